@@ -0,0 +1,164 @@
+"""Benchmark suite for the transformation passes in ptetools.qiskit
+
+Random circuits of controlled width and size are generated, either from layers of random Clifford gates or from a
+random mix of U gates, rotations, delays and CX gates. Each pass and the full chain of passes is timed on every
+circuit. The results are written as JSON, so different runs can be compared.
+
+Usage:
+    python benchmarks/benchmark_passes.py --output results.json
+    python benchmarks/benchmark_passes.py --qubits 2 5 --gates 1000 10000 --repeats 5 --compare baseline.json
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import time
+from collections.abc import Callable, Sequence
+from typing import Any
+
+import numpy as np
+import qiskit
+from circuits import CIRCUIT_GENERATORS
+from qiskit.circuit import QuantumCircuit
+from qiskit.circuit.library import CXGate
+from qiskit.converters import circuit_to_dag
+from qiskit.transpiler.basepasses import TransformationPass
+
+import ptetools
+from ptetools.qiskit import (
+    DecomposeU,
+    ModifyDelayGate,
+    RemoveSmallRotations,
+    RemoveZeroDelayGate,
+    ReplaceGate,
+)
+
+
+def benchmark_passes() -> dict[str, Callable[[], TransformationPass]]:
+    """Return factories for the benchmarked passes
+
+    A new pass is created for every timing, so caches in the passes are empty at the start of each run.
+    """
+    cx_replacement = QuantumCircuit(2)
+    cx_replacement.h(1)
+    cx_replacement.cz(0, 1)
+    cx_replacement.h(1)
+
+    return {
+        "ModifyDelayGate": lambda: ModifyDelayGate(dt=20e-9),
+        "RemoveZeroDelayGate": RemoveZeroDelayGate,
+        "ReplaceGate": lambda: ReplaceGate(CXGate, cx_replacement),
+        "DecomposeU": DecomposeU,
+        "RemoveSmallRotations": lambda: RemoveSmallRotations(epsilon=1e-3, modulo2pi=True),
+    }
+
+
+def time_passes(qc: QuantumCircuit, passes: Callable[[], Sequence[TransformationPass]], repeats: int) -> list[float]:
+    """Return durations of running the passes on the DAG of the circuit
+
+    The conversion between circuit and DAG is not included in the timing.
+    """
+    durations = []
+    for _ in range(repeats):
+        dag = circuit_to_dag(qc)
+        transformation_passes = passes()
+        t0 = time.perf_counter()
+        for transformation_pass in transformation_passes:
+            dag = transformation_pass.run(dag)
+        durations.append(time.perf_counter() - t0)
+    return durations
+
+
+def run_benchmarks(
+    circuit_types: Sequence[str],
+    qubits: Sequence[int],
+    gates: Sequence[int],
+    repeats: int = 3,
+    seed: int = 1,
+    verbose: bool = True,
+) -> dict[str, Any]:
+    """Run the benchmarks and return the results as a JSON serializable dictionary"""
+    factories = benchmark_passes()
+    chains: dict[str, Callable[[], Sequence[TransformationPass]]] = {
+        name: (lambda factory=factory: [factory()]) for name, factory in factories.items()
+    }
+    chains["chain"] = lambda: [factory() for factory in factories.values()]
+
+    results = []
+    for circuit_type in circuit_types:
+        for number_of_qubits in qubits:
+            for number_of_gates in gates:
+                qc = CIRCUIT_GENERATORS[circuit_type](number_of_qubits, number_of_gates, seed)
+                circuit_data = {
+                    "circuit": circuit_type,
+                    "number_of_qubits": number_of_qubits,
+                    "number_of_gates": qc.size(),
+                    "depth": qc.depth(),
+                    "gate_counts": dict(qc.count_ops()),
+                }
+                if verbose:
+                    print(f"{circuit_type}: {number_of_qubits} qubits, {qc.size()} gates, depth {qc.depth()}")
+                for name, chain in chains.items():
+                    durations = time_passes(qc, chain, repeats)
+                    results.append(
+                        circuit_data
+                        | {
+                            "pass": name,
+                            "durations": durations,
+                            "minimum": min(durations),
+                            "median": statistics.median(durations),
+                        }
+                    )
+                    if verbose:
+                        per_gate = 1e6 * min(durations) / max(qc.size(), 1)
+                        print(f"  {name:24s}: {min(durations):8.4f} [s], {per_gate:.2f} [us/gate]")
+
+    metadata = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "qiskit": qiskit.__version__,
+        "ptetools": ptetools.__version__,
+        "repeats": repeats,
+        "seed": seed,
+    }
+    return {"metadata": metadata, "results": results}
+
+
+def _result_key(result: dict[str, Any]) -> tuple:
+    return (result["circuit"], result["number_of_qubits"], result["number_of_gates"], result["pass"])
+
+
+def compare_results(results: dict[str, Any], baseline: dict[str, Any]) -> None:
+    """Print the ratio of the minimum durations of the results and a baseline run"""
+    baseline_durations = {_result_key(result): result["minimum"] for result in baseline["results"]}
+    print(f"comparison with baseline from {baseline['metadata']['timestamp']} (ratio > 1 is slower):")
+    for result in results["results"]:
+        key = _result_key(result)
+        if key in baseline_durations:
+            ratio = result["minimum"] / baseline_durations[key]
+            print(f"  {key[0]}, {key[1]} qubits, {key[2]} gates, {key[3]:24s}: {ratio:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--circuits", nargs="+", default=list(CIRCUIT_GENERATORS), choices=list(CIRCUIT_GENERATORS))
+    parser.add_argument("--qubits", nargs="+", type=int, default=[2, 10])
+    parser.add_argument("--gates", nargs="+", type=int, default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=str, default=None, help="filename for the JSON results")
+    parser.add_argument("--compare", type=str, default=None, help="JSON results of a baseline run")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.circuits, args.qubits, args.gates, args.repeats, args.seed)
+    if args.output:
+        with open(args.output, "w") as fid:
+            json.dump(results, fid, indent=2)
+        print(f"results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as fid:
+            compare_results(results, json.load(fid))
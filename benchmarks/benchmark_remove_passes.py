@@ -0,0 +1,78 @@
+"""Benchmark of the node removal passes for circuits with 10^4 to 10^6 gates
+
+Usage:
+    python benchmarks/benchmark_remove_passes.py [--max-gates 1000000] [--repeats 3]
+
+For each circuit size the time per gate is reported for RemoveSmallRotations and RemoveZeroDelayGate.
+The reference implementation removes nodes by substituting an empty DAG, which is how the passes
+operated before direct node removal.
+"""
+
+import argparse
+import time
+from collections.abc import Callable
+
+import numpy as np
+from circuits import mixed_circuit
+from qiskit.circuit import QuantumCircuit
+from qiskit.circuit.library import CRXGate, CRYGate, CRZGate, PhaseGate, RXGate, RYGate, RZGate
+from qiskit.converters import circuit_to_dag
+from qiskit.dagcircuit import DAGCircuit
+
+from ptetools.qiskit import RemoveSmallRotations, RemoveZeroDelayGate
+
+
+def reference_remove_small_rotations(dag: DAGCircuit, epsilon: float = 0) -> DAGCircuit:
+    empty_dag1 = circuit_to_dag(QuantumCircuit(1), copy_operations=False)
+    empty_dag2 = circuit_to_dag(QuantumCircuit(2), copy_operations=False)
+    for node in dag.op_nodes():
+        if isinstance(node.op, (PhaseGate, RXGate, RYGate, RZGate, CRXGate, CRYGate, CRZGate)):
+            if not node.op.is_parameterized() and np.abs(float(node.op.params[0])) <= epsilon:
+                dag.substitute_node_with_dag(node, empty_dag1 if node.op.num_qubits == 1 else empty_dag2)
+    return dag
+
+
+def reference_remove_zero_delay_gate(dag: DAGCircuit) -> DAGCircuit:
+    empty_dag1 = circuit_to_dag(QuantumCircuit(1), copy_operations=False)
+    for node in dag.op_nodes():
+        if node.op.name == "delay" and node.op.params[0] == 0:
+            dag.substitute_node_with_dag(node, empty_dag1)
+    return dag
+
+
+def time_dag_function(function: Callable[[DAGCircuit], DAGCircuit], qc: QuantumCircuit, repeats: int) -> float:
+    """Return the minimum duration of applying function to the DAG of the circuit"""
+    durations = []
+    for _ in range(repeats):
+        dag = circuit_to_dag(qc)
+        t0 = time.perf_counter()
+        function(dag)
+        durations.append(time.perf_counter() - t0)
+    return min(durations)
+
+
+def main(max_gates: int = 1_000_000, repeats: int = 3, number_of_qubits: int = 20) -> None:
+    functions: dict[str, Callable[[DAGCircuit], DAGCircuit]] = {
+        "RemoveSmallRotations": RemoveSmallRotations().run,
+        "RemoveSmallRotations (reference)": reference_remove_small_rotations,
+        "RemoveZeroDelayGate": RemoveZeroDelayGate().run,
+        "RemoveZeroDelayGate (reference)": reference_remove_zero_delay_gate,
+    }
+
+    number_of_gates = 10_000
+    while number_of_gates <= max_gates:
+        qc = mixed_circuit(number_of_qubits, number_of_gates, seed=1)
+        print(f"circuit with {number_of_gates} gates:")
+        for name, function in functions.items():
+            dt = time_dag_function(function, qc, repeats)
+            print(f"  {name:34s}: {dt:8.3f} [s], {1e6 * dt / number_of_gates:.2f} [us/gate]")
+        number_of_gates *= 10
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-gates", type=int, default=1_000_000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--qubits", type=int, default=20)
+    args = parser.parse_args()
+    main(args.max_gates, args.repeats, args.qubits)
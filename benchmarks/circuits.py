@@ -0,0 +1,75 @@
+"""Random circuits for the benchmarks of the transformation passes in ptetools.qiskit"""
+
+import random
+from collections.abc import Callable
+
+import numpy as np
+from qiskit.circuit import QuantumCircuit
+
+from ptetools.qiskit import random_clifford_circuit
+
+
+def clifford_layers_circuit(number_of_qubits: int, number_of_gates: int, seed: int) -> QuantumCircuit:
+    """Circuit with layers of random single- and two-qubit Clifford gates on random qubits"""
+    random.seed(seed)
+    rng = np.random.default_rng(seed)
+    qc = QuantumCircuit(number_of_qubits)
+    while qc.size() < number_of_gates:
+        qubits = rng.permutation(number_of_qubits).tolist()
+        while qubits:
+            if len(qubits) >= 2 and rng.random() < 0.5:
+                clifford, _ = random_clifford_circuit(2)
+                qc.compose(clifford, qubits[:2], inplace=True)
+                qubits = qubits[2:]
+            else:
+                clifford, _ = random_clifford_circuit(1)
+                qc.compose(clifford, qubits[:1], inplace=True)
+                qubits = qubits[1:]
+    return qc
+
+
+def mixed_circuit(number_of_qubits: int, number_of_gates: int, seed: int) -> QuantumCircuit:
+    """Circuit with a random mix of U gates, rotations, delays and CX gates
+
+    A quarter of the rotation angles and delay durations is zero.
+    """
+    rng = np.random.default_rng(seed)
+    qubits = rng.integers(number_of_qubits, size=number_of_gates).tolist()
+    kinds = rng.integers(9, size=number_of_gates).tolist()
+    angles = np.where(rng.random(number_of_gates) < 0.25, 0.0, rng.normal(size=number_of_gates)).tolist()
+
+    qc = QuantumCircuit(number_of_qubits)
+    for q, kind, angle in zip(qubits, kinds, angles):
+        q2 = (q + 1) % number_of_qubits
+        match kind:
+            case 0:
+                qc.u(angle, 0.5, -0.5, q)
+            case 1:
+                qc.p(angle, q)
+            case 2:
+                qc.rz(angle, q)
+            case 3:
+                qc.rx(angle, q)
+            case 4:
+                if number_of_qubits > 1:
+                    qc.crz(angle, q, q2)
+                else:
+                    qc.ry(angle, q)
+            case 5:
+                qc.delay(abs(angle) * 1e-6, q, unit="s")
+            case 6:
+                qc.delay(0 if angle == 0 else 100, q)
+            case 7:
+                if number_of_qubits > 1:
+                    qc.cx(q, q2)
+                else:
+                    qc.x(q)
+            case 8:
+                qc.sx(q)
+    return qc
+
+
+CIRCUIT_GENERATORS: dict[str, Callable[[int, int, int], QuantumCircuit]] = {
+    "clifford_layers": clifford_layers_circuit,
+    "mixed": mixed_circuit,
+}
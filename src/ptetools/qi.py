@@ -1,7 +1,14 @@
 # pragma: no cover
 
 import datetime
-from typing import Any
+import itertools
+from collections.abc import Sequence
+from typing import TYPE_CHECKING, Any, Literal
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from ptetools.qiskit import CountsArray
 
 
 def starmon5_backend(backend_name: str = "Starmon-5", number_of_shots: int | None = None) -> Any:  # pragma: no cover
@@ -25,24 +32,88 @@ def starmon5_backend(backend_name: str = "Starmon-5", number_of_shots: int | Non
 
 
 # %%
+_hex_digit_values = np.full(256, -1, dtype=np.int8)
+for _digit in "0123456789abcdef":
+    _hex_digit_values[ord(_digit)] = _hex_digit_values[ord(_digit.upper())] = int(_digit, 16)
+
+
+def hexstrings2indices(hexstrings: Sequence[str]) -> np.ndarray:
+    """Convert hexadecimal strings (with optional 0x prefix) to integer indices
+
+    The strings are parsed in bulk from a byte-level view of the strings.
+
+    Example:
+        >>> hexstrings2indices(["0x0", "0x4", "1f"])
+        array([ 0,  4, 31])
+    """
+    if len(hexstrings) == 0:
+        return np.zeros(0, dtype=np.int64)
+    encoded = np.array(hexstrings, dtype=bytes)
+    chars = encoded.view(np.uint8).reshape(len(hexstrings), encoded.itemsize)
+    digit_values = _hex_digit_values[chars]
+    valid = digit_values >= 0
+    digits = np.where(valid, digit_values, 0).astype(np.uint64)
+    if np.any(~valid & (chars != ord("x")) & (chars != ord("X")) & (chars != 0)):
+        raise ValueError("invalid hexadecimal string")
+
+    # position of each digit counted from the right, ignoring the prefix and padding
+    rank = np.cumsum(valid[:, ::-1], axis=1)[:, ::-1] - 1
+    if np.any(valid & (rank >= 16) & (digits > 0)):
+        raise ValueError("hexadecimal strings with more than 64 bits are not supported")
+    shifts = (4 * np.clip(rank, 0, 15)).astype(np.uint64)
+    values = np.bitwise_or.reduce(np.where(valid, digits << shifts, np.uint64(0)), axis=1)
+    if np.any(values >= 2**63):
+        raise ValueError("hexadecimal strings with more than 63 bits are not supported")
+    return values.astype(np.int64)
+
+
 def qi_counts2qiskit(counts: dict[str, int], num_bits: int) -> dict[str, int]:
     """Convert measurement histogram from qi 1.0 to qiskit convention"""
-    fmt = f"{{:0{num_bits}b}}"
+    return qi_counts2qiskit_batch([counts], num_bits)[0]
+
+
+def qi_counts2qiskit_batch(
+    counts: Sequence[dict[str, int]], num_bits: int, output: Literal["dict", "counts_array"] = "dict"
+) -> list[dict[str, int]] | list["CountsArray"]:
+    """Convert measurement histograms from qi 1.0 to qiskit convention
 
-    def convert(i):
-        v = int(i, 16)
-        return fmt.format(v)
+    The keys of all histograms are parsed with a single call to `hexstrings2indices`.
 
-    return {convert(k): v for k, v in counts.items()}
+    Args:
+        counts: Sequence of histograms with hexadecimal keys
+        num_bits: Number of bits
+        output: If "dict", return dictionaries with bitstrings as keys. If "counts_array" return
+            `ptetools.qiskit.CountsArray` objects, avoiding the formatting of the bitstrings
+    Returns:
+        List with converted histograms
+    """
+    indices = hexstrings2indices(list(itertools.chain.from_iterable(counts)))
+    if indices.size and indices.max() >= 2**num_bits:
+        raise ValueError(f"outcome {indices.max()} does not fit in {num_bits} bits")
+    offsets = np.cumsum([0] + [len(c) for c in counts])
+
+    from ptetools.qiskit import CountsArray, indices2bitstrings  # lazy import
+
+    match output:
+        case "dict":
+            bitstrings = indices2bitstrings(indices, num_bits)
+            return [dict(zip(bitstrings[offsets[ii] : offsets[ii + 1]], c.values())) for ii, c in enumerate(counts)]
+        case "counts_array":
+            return [
+                CountsArray(indices[offsets[ii] : offsets[ii + 1]], list(c.values()), num_bits)
+                for ii, c in enumerate(counts)
+            ]
+        case _:
+            raise ValueError(f"output {output} is invalid")
 
 
 if __name__ == "__main__":  # pragma: no cover
-    from qiskit.result import marginal_counts
+    from ptetools.qiskit import marginalize_counts
 
     mm = [{"0x0": 8182, "0x4": 10}, {"0x0": 4137, "0x4": 4055}, {"0x0": 263, "0x4": 7929}]
     mmq = [qi_counts2qiskit(m, 5) for m in mm]
     print(mmq)
-    print(marginal_counts(mmq[1], [2]))
+    print(marginalize_counts(mmq[1], [2]))
 
 
 # %%
@@ -1,13 +1,15 @@
 import itertools
 import logging
 import math
+import os
 import pathlib
 import random
 import tempfile
-from collections.abc import Iterator, Mapping, Sequence
-from functools import lru_cache
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
+from dataclasses import dataclass
+from functools import lru_cache, wraps
 from numbers import Real
-from typing import Any, overload
+from typing import Any, Literal, overload
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -18,8 +20,7 @@ import qiskit.converters
 import qiskit.quantum_info as qi
 import qiskit.result
 import qiskit_experiments.framework.containers.figure_data
-import qutip.core.superop_reps
-from qiskit.circuit import Delay, Instruction
+from qiskit.circuit import Delay, Instruction, Parameter, ParameterExpression
 from qiskit.circuit.library import (
     CRXGate,
     CRYGate,
@@ -35,10 +36,10 @@ from qiskit.circuit.library import (
 )
 from qiskit.circuit.quantumcircuit import QuantumCircuit
 from qiskit.converters.circuit_to_dag import circuit_to_dag
-from qiskit.dagcircuit import DAGCircuit
-from qiskit.transpiler.basepasses import TransformationPass
+from qiskit.dagcircuit import DAGCircuit, DAGOpNode
+from qiskit.transpiler import PassManager
+from qiskit.transpiler.basepasses import BasePass, TransformationPass
 from qiskit_experiments.library.randomized_benchmarking.clifford_utils import CliffordUtils
-from qutip import Qobj
 
 CountsType = Mapping[str, int | float]
 FractionsType = Mapping[str, float]
@@ -47,10 +48,31 @@ IntArrayLike = np.typing.NDArray[np.int64 | np.int32] | list[int] | tuple[int, .
 FloatArray = np.typing.NDArray[np.float64]
 ComplexArray = np.typing.NDArray[np.complex128]
 
+MAXIMUM_DENSE_NUMBER_OF_BITS = 28  # dense arrays of 64-bit values up to 2 GB are allocated in memory
+MAXIMUM_CACHED_NUMBER_OF_BITS = 16  # tables for more bits are not cached, so the cache does not keep them alive
+
 
 # %% Bit conversions
 
 
+def _cache_small_number_of_bits(function: Callable) -> Callable:
+    """Cache the results of a function of the number of bits for up to MAXIMUM_CACHED_NUMBER_OF_BITS bits
+
+    The tables for a larger number of bits are recomputed on every call.
+    """
+    cached_function = lru_cache(maxsize=None)(function)
+
+    @wraps(function)
+    def wrapper(number_of_bits: int, *args: Any, **kwargs: Any) -> Any:
+        if number_of_bits <= MAXIMUM_CACHED_NUMBER_OF_BITS:
+            return cached_function(number_of_bits, *args, **kwargs)
+        return function(number_of_bits, *args, **kwargs)
+
+    wrapper.cache_info = cached_function.cache_info  # type: ignore[attr-defined]
+    wrapper.cache_clear = cached_function.cache_clear  # type: ignore[attr-defined]
+    return wrapper
+
+
 def generate_bitstring_tuples(number_of_bits: int) -> Iterator[tuple[int, ...]]:
     return itertools.product(*((0, 1),) * (number_of_bits))
 
@@ -62,8 +84,108 @@ def generate_bitstrings(number_of_bits: int) -> list[str]:
         >>> generate_bitstrings(2)
         ['00', '01', '10', '11']
     """
-    fmt = f"{{:0{number_of_bits}b}}"
-    return [fmt.format(w) for w in range(2**number_of_bits)]
+    if number_of_bits < 1:
+        return [index2bitstring(0, number_of_bits)]
+    if number_of_bits > MAXIMUM_CACHED_NUMBER_OF_BITS:
+        # without a cached table, formatting the bitstrings directly avoids the intermediate arrays
+        fmt = f"{{:0{number_of_bits}b}}"
+        return [fmt.format(w) for w in range(2**number_of_bits)]
+    return bitstring_array(number_of_bits).tolist()
+
+
+@_cache_small_number_of_bits
+def bit_matrix(number_of_bits: int) -> np.typing.NDArray[np.uint8]:
+    """Return the bits of all outcomes for the specified number of bits
+
+    The result is read-only, and cached for up to MAXIMUM_CACHED_NUMBER_OF_BITS bits. Row ``i`` contains the bits of
+    ``index2bitstring(i, number_of_bits)``, so the last column contains the LSB.
+
+    Example:
+        >>> bit_matrix(2)
+        array([[0, 0],
+               [0, 1],
+               [1, 0],
+               [1, 1]], dtype=uint8)
+    """
+    if not 0 <= number_of_bits <= MAXIMUM_DENSE_NUMBER_OF_BITS:
+        raise ValueError(f"number_of_bits {number_of_bits} is not supported")
+    # only the bytes that contain the bits are unpacked
+    number_of_bytes = (number_of_bits + 7) // 8
+    indices = np.arange(2**number_of_bits, dtype=">u4").view(np.uint8).reshape(-1, 4)[:, 4 - number_of_bytes :]
+    bits = np.ascontiguousarray(np.unpackbits(indices, axis=1)[:, 8 * number_of_bytes - number_of_bits :])
+    bits.flags.writeable = False
+    return bits
+
+
+@_cache_small_number_of_bits
+def bitstring_array(number_of_bits: int, dtype: Literal["U", "S"] = "U") -> np.ndarray:
+    """Return array with the bitstrings for the specified number of bits
+
+    The result is read-only, and cached for up to MAXIMUM_CACHED_NUMBER_OF_BITS bits.
+
+    Args:
+        number_of_bits: Number of bits
+        dtype: Either "U" for a unicode string array or "S" for a bytes array
+    Returns:
+        Array of size 2**number_of_bits with fixed width strings
+
+    Example:
+        >>> bitstring_array(2)
+        array(['00', '01', '10', '11'], dtype='<U2')
+    """
+    if number_of_bits < 1:
+        raise ValueError(f"number_of_bits {number_of_bits} is not supported")
+    labels = (bit_matrix(number_of_bits) + np.uint8(ord("0"))).view(f"S{number_of_bits}").reshape(-1)
+    if dtype == "U":
+        labels = labels.astype(f"U{number_of_bits}")
+    elif dtype != "S":
+        raise ValueError(f"dtype {dtype} is not supported")
+    labels.flags.writeable = False
+    return labels
+
+
+class BitstringLabels(Sequence[str]):
+    """Read-only sequence with the bitstring labels for the specified number of bits
+
+    The labels are formatted on demand, so the sequence can be used for a large number of bits.
+
+    Example:
+        >>> labels = BitstringLabels(40, template="|{}>")
+        >>> labels[5]
+        '|0000000000000000000000000000000000000101>'
+    """
+
+    def __init__(self, number_of_bits: int, template: str = "{}") -> None:
+        """
+        Args:
+            number_of_bits: Number of bits
+            template: Format string applied to each bitstring
+        """
+        if not 0 <= number_of_bits <= 62:
+            raise ValueError(f"number_of_bits {number_of_bits} is not supported")
+        self.number_of_bits = number_of_bits
+        self.template = template
+
+    def __len__(self) -> int:
+        return 2**self.number_of_bits
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[str]: ...
+
+    def __getitem__(self, index: int | slice) -> str | list[str]:
+        if isinstance(index, slice):
+            return [self[idx] for idx in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"index {index} out of range")
+        return self.template.format(index2bitstring(index, self.number_of_bits))
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(number_of_bits={self.number_of_bits}, template={self.template!r})"
 
 
 def invert_permutation(permutation) -> IntArray:
@@ -80,8 +202,7 @@ def bitlist_to_int(bitlist: Sequence[int]) -> int:
 
 
 def index2bitstring(index: int, number_of_bits: int) -> str:
-    fmt = f"{{:0{number_of_bits}b}}"
-    return fmt.format(index)
+    return f"{index:0{number_of_bits}b}"
 
 
 def permute_bits(idx: int, permutation: Sequence[int]) -> int:
@@ -99,20 +220,328 @@ def permute_string(string: str, permutation: Sequence[int]) -> str:
     return "".join(permuted)
 
 
-def permute_counts(counts: CountsType, permutation: Sequence[int]) -> CountsType:
+@lru_cache(maxsize=128)
+def _bit_selection_tables(selection: tuple[int, ...]) -> np.typing.NDArray[np.uint64]:
+    """Return per-byte lookup tables for selection of bits
+
+    Entry ``[b, v]`` of the tables is the contribution to the output of byte ``b`` of the input having value ``v``.
+    """
+    if len(set(selection)) != len(selection) or any(not 0 <= position < 64 for position in selection):
+        raise ValueError(f"invalid selection of bits {selection}")
+    number_of_bytes = max(selection, default=-1) // 8 + 1
+    values = np.arange(256, dtype=np.uint64)
+    tables = np.zeros((number_of_bytes, 256), dtype=np.uint64)
+    for target, position in enumerate(selection):
+        byte, bit = divmod(position, 8)
+        tables[byte] |= ((values >> np.uint64(bit)) & np.uint64(1)) << np.uint64(target)
+    tables.flags.writeable = False
+    return tables
+
+
+def _select_bits(byte_values: Sequence[np.ndarray], selection: tuple[int, ...]) -> np.typing.NDArray[np.uint64]:
+    """Select bits from integers split into bytes"""
+    tables = _bit_selection_tables(selection)
+    if len(tables) == 0:
+        return np.zeros_like(byte_values[0])
+    result = tables[0][byte_values[0]]
+    for byte in range(1, len(tables)):
+        result |= tables[byte][byte_values[byte]]
+    return result
+
+
+def _split_bytes(indices: np.ndarray, number_of_bytes: int) -> list[np.ndarray]:
+    """Split array of non-negative integers into the values of the individual bytes (at least one)"""
+    x = indices.astype(np.uint64, copy=False)
+    return [(x >> np.uint64(8 * byte)) & np.uint64(0xFF) for byte in range(max(number_of_bytes, 1))]
+
+
+def select_bits_array(indices: np.typing.ArrayLike, selection: Sequence[int]) -> np.ndarray:
+    """Select bits for an array of integers
+
+    Bit ``j`` of the output is bit ``selection[j]`` of the input. Bits are selected using precomputed per-byte
+    lookup tables.
+
+    Args:
+        indices: Array of non-negative integers with dtype int64 or uint64
+        selection: Positions of the bits to select
+    Returns:
+        Array with the selected bits, with the same dtype as the input
+    """
+    indices = np.asarray(indices)
+    if indices.dtype.kind not in "iu":
+        raise TypeError(f"unsupported dtype {indices.dtype}")
+    selection = tuple(int(p) for p in selection)
+    byte_values = _split_bytes(indices, max(selection, default=-1) // 8 + 1)
+    return _select_bits(byte_values, selection).astype(indices.dtype, copy=False)
+
+
+def permute_bits_array(indices: np.typing.ArrayLike, permutation: Sequence[int]) -> np.ndarray:
+    """Permute position of bits for an array of integers
+
+    This is the vectorized version of `permute_bits`. Bit ``j`` of the output is bit ``permutation[j]`` of the input.
+
+    Args:
+        indices: Array of non-negative integers with dtype int64 or uint64
+        permutation: Permutation of the bits
+    Returns:
+        Array with the permuted integers, with the same dtype as the input
+    """
+    if sorted(permutation) != list(range(len(permutation))):
+        raise ValueError(f"invalid permutation {permutation}")
+    return select_bits_array(indices, permutation)
+
+
+def bitstrings2indices(bitstrings: Sequence[str]) -> IntArray:
+    """Convert bitstrings to integer outcome indices
+
+    Spaces separating classical registers are ignored. The bitstrings are parsed in bulk from a byte-level view
+    of the strings, so this is much faster than parsing each bitstring with `int`.
+
+    Example:
+        >>> bitstrings2indices(["00", "11", "1 0"])
+        array([0, 3, 2])
+    """
+    if len(bitstrings) == 0:
+        return np.zeros(0, dtype=np.int64)
+    encoded = np.array(bitstrings, dtype=bytes)
+    chars = encoded.view(np.uint8).reshape(len(bitstrings), encoded.itemsize)
+    ones = chars == ord("1")
+    valid = ones | (chars == ord("0"))
+
+    bits = np.zeros((len(bitstrings), 64), dtype=np.uint8)
+    if valid.all():
+        if chars.shape[1] > 63:
+            raise ValueError("bitstrings with more than 63 bits are not supported")
+        bits[:, 64 - chars.shape[1] :] = ones
+    else:
+        if np.any(~valid & (chars != ord(" ")) & (chars != 0)):
+            raise ValueError("bitstrings can only contain the characters 0, 1 and space")
+        # position of each bit counted from the right, ignoring spaces and padding
+        rank = np.cumsum(valid[:, ::-1], axis=1)[:, ::-1]
+        if rank[:, 0].max() > 63:
+            raise ValueError("bitstrings with more than 63 bits are not supported")
+        rows, columns = np.nonzero(valid)
+        bits[rows, 64 - rank[rows, columns]] = ones[rows, columns]
+    return np.packbits(bits, axis=1).view(">u8").reshape(-1).astype(np.int64)
+
+
+def indices2bitstrings(indices: np.typing.ArrayLike, number_of_bits: int) -> list[str]:
+    """Convert integer outcome indices to bitstrings
+
+    This is the inverse of `bitstrings2indices`. The bitstrings are created in bulk from the unpacked bits.
+
+    Example:
+        >>> indices2bitstrings([0, 3, 2], 2)
+        ['00', '11', '10']
+    """
+    indices = np.asarray(indices).reshape(-1)
+    if number_of_bits < 1 or indices.size == 0:
+        return [index2bitstring(idx, number_of_bits) for idx in indices.tolist()]
+    if number_of_bits > 64:
+        raise ValueError(f"number_of_bits {number_of_bits} is not supported")
+    bits = np.unpackbits(indices.astype(">u8").view(np.uint8).reshape(-1, 8), axis=1)[:, 64 - number_of_bits :]
+    labels = np.ascontiguousarray(bits + np.uint8(ord("0"))).view(f"S{number_of_bits}").reshape(-1)
+    return labels.astype(f"U{number_of_bits}").tolist()
+
+
+class CountsArray:
+    """Measurement histogram stored as sorted integer outcome indices and counts
+
+    The outcome indices use the Qiskit convention: the LSB of the index is the rightmost character of the bitstring.
+    Duplicate outcomes are merged on construction. The counts can be integer counts or fractions.
+    """
+
+    def __init__(self, indices: IntArrayLike, counts: np.typing.ArrayLike, number_of_bits: int) -> None:
+        """
+        Args:
+            indices: Outcome indices
+            counts: Counts (or fractions) for each outcome
+            number_of_bits: Number of bits in the measured register
+        """
+        if not 0 <= number_of_bits <= 63:
+            raise ValueError(f"number_of_bits {number_of_bits} is not supported")
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        counts = np.asarray(counts).reshape(-1)
+        if indices.size != counts.size:
+            raise ValueError(f"size of indices ({indices.size}) does not match size of counts ({counts.size})")
+        if indices.size and (indices.min() < 0 or indices.max() >= 2**number_of_bits):
+            raise ValueError(f"indices out of range for {number_of_bits} bits")
+
+        if np.any(indices[1:] <= indices[:-1]):
+            indices, inverse = np.unique(indices, return_inverse=True)
+            counts = np.bincount(inverse, weights=counts, minlength=indices.size).astype(counts.dtype)
+        self.indices: IntArray = indices
+        self.counts: np.ndarray = counts
+        self.number_of_bits: int = number_of_bits
+
+    @classmethod
+    def from_dict(cls, counts: CountsType, number_of_bits: int | None = None) -> "CountsArray":
+        """Create from a dictionary with bitstrings as keys
+
+        Args:
+            counts: Dictionary with counts or fractions
+            number_of_bits: Number of bits. If None, determine from the length of the bitstrings
+        """
+        keys = list(counts)
+        if number_of_bits is None:
+            number_of_bits = max((len(k.replace(" ", "")) for k in keys), default=0)
+        return cls(bitstrings2indices(keys), np.array(list(counts.values())), number_of_bits)
+
+    @classmethod
+    def from_dense(cls, d: np.typing.ArrayLike) -> "CountsArray":
+        """Create from a dense array of length 2**number_of_bits"""
+        d = np.asarray(d).reshape(-1)
+        number_of_bits = int(np.log2(d.size))
+        indices = np.flatnonzero(d)
+        return cls(indices, d[indices], number_of_bits)
+
+    def to_dict(self) -> dict[str, Any]:
+        """Convert to dictionary with bitstrings as keys"""
+        return dict(zip(indices2bitstrings(self.indices, self.number_of_bits), self.counts.tolist()))
+
+    def to_dense(self, filename: str | os.PathLike | None = None) -> np.ndarray:
+        """Convert to dense array of length 2**number_of_bits
+
+        See `counts2dense` for a description of the arguments.
+        """
+        return counts2dense(self, self.number_of_bits, filename=filename)
+
+    def total(self) -> Any:
+        """Return total number of counts"""
+        return self.counts.sum().item()
+
+    def __len__(self) -> int:
+        return self.indices.size
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, CountsArray):
+            return NotImplemented
+        return (
+            self.number_of_bits == other.number_of_bits
+            and np.array_equal(self.indices, other.indices)
+            and np.array_equal(self.counts, other.counts)
+        )
+
+    def __repr__(self) -> str:
+        name = self.__class__.__name__
+        return f"{name}(number_of_bits={self.number_of_bits}, indices={self.indices!r}, counts={self.counts!r})"
+
+
+@overload
+def permute_counts(counts: CountsArray, permutation: Sequence[int]) -> CountsArray: ...
+
+
+@overload
+def permute_counts(counts: CountsType, permutation: Sequence[int]) -> CountsType: ...
+
+
+def permute_counts(counts: CountsType | CountsArray, permutation: Sequence[int]) -> CountsType | CountsArray:
     """Permute bits in a counts for fractions object
 
     For the bits we use the Qiskit convention: LSB has index zero
     """
-    return {permute_string(bitstring[::-1], permutation)[::-1]: value for bitstring, value in counts.items()}
+    return permute_counts_batch([counts], permutation)[0]
+
+
+def permute_counts_batch(
+    counts: Sequence[CountsType | CountsArray], permutation: Sequence[int]
+) -> list[CountsType | CountsArray]:
+    """Permute bits for a list of counts or fractions objects
+
+    The outcomes of all histograms are permuted with a single call to `permute_bits_array`.
+    For the bits we use the Qiskit convention: LSB has index zero
+    """
+    keys = [list(c) for c in counts if not isinstance(c, CountsArray)]
+    key_indices = bitstrings2indices(list(itertools.chain.from_iterable(keys)))
+    array_indices = [c.indices for c in counts if isinstance(c, CountsArray)]
+
+    permuted = permute_bits_array(np.concatenate([key_indices, *array_indices]), permutation)
+    permuted_keys = iter(indices2bitstrings(permuted[: key_indices.size], len(permutation)))
+    offset = key_indices.size
+
+    result: list[CountsType | CountsArray] = []
+    for c in counts:
+        if isinstance(c, CountsArray):
+            result.append(CountsArray(permuted[offset : offset + len(c)], c.counts, c.number_of_bits))
+            offset += len(c)
+        else:
+            result.append({next(permuted_keys): value for value in c.values()})
+    return result
+
+
+@overload
+def marginalize_counts(counts: CountsArray, qubits: Sequence[int]) -> CountsArray: ...
+
+
+@overload
+def marginalize_counts(counts: CountsType, qubits: Sequence[int]) -> CountsType: ...
+
+
+def marginalize_counts(counts: CountsType | CountsArray, qubits: Sequence[int]) -> CountsType | CountsArray:
+    """Marginalize counts or fractions over all bits except the selected qubits
+
+    The ordering convention is the same as for `permute_counts`: bit ``j`` of the marginal outcome
+    is bit ``qubits[j]`` of the full outcome, with LSB index zero.
+
+    Args:
+        counts: Counts or fractions
+        qubits: Qubits to keep
+    Returns:
+        Marginal counts or fractions of the same type as the input
+    """
+    counts_array = counts if isinstance(counts, CountsArray) else CountsArray.from_dict(counts)
+    if any(not 0 <= q < counts_array.number_of_bits for q in qubits):
+        raise ValueError(f"qubits {qubits} invalid for {counts_array.number_of_bits} bits")
+    marginal = CountsArray(select_bits_array(counts_array.indices, qubits), counts_array.counts, len(qubits))
+    if isinstance(counts, CountsArray):
+        return marginal
+    return marginal.to_dict()
+
+
+def marginalize_counts_batch(
+    counts: Sequence[CountsType | CountsArray], subsets: Sequence[Sequence[int]]
+) -> list[np.ndarray]:
+    """Marginalize a list of counts or fractions over many subsets of qubits
+
+    The bits of all outcomes are split into bytes once, the marginal outcomes for each subset are determined with
+    lookup tables and aggregated with `np.bincount`. The ordering convention is the same as for `permute_counts`.
+
+    Args:
+        counts: Sequence of counts or fractions
+        subsets: Sequence with the qubits to keep for each marginal
+    Returns:
+        For each subset a dense array of shape ``(len(counts), 2**len(subset))``
+    """
+    subsets = [tuple(int(q) for q in subset) for subset in subsets]
+    if any(len(subset) > MAXIMUM_DENSE_NUMBER_OF_BITS for subset in subsets):
+        raise ValueError(f"marginals can have at most {MAXIMUM_DENSE_NUMBER_OF_BITS} bits")
+    rows, outcomes, data = _flatten_counts_batch(counts)
+    number_of_bytes = max((max(subset, default=-1) // 8 + 1 for subset in subsets), default=0)
+    byte_values = _split_bytes(outcomes, number_of_bytes)
+
+    marginals = []
+    for subset in subsets:
+        size = 2 ** len(subset)
+        flat_index = rows * size + _select_bits(byte_values, subset).astype(np.int64)
+        hist = np.bincount(flat_index, weights=data, minlength=len(counts) * size)
+        marginals.append(hist.astype(data.dtype, copy=False).reshape(len(counts), size))
+    return marginals
 
 
 def generate_state_labels(k: int, latex: bool = True):
-    """Generate state labels for the specified number of qubits"""
+    """Generate state labels for the specified number of qubits
+
+    For a large number of qubits use `BitstringLabels` to format the labels on demand.
+    """
+    return list(_state_labels(k, latex))
+
+
+@_cache_small_number_of_bits
+def _state_labels(k: int, latex: bool) -> tuple[str, ...]:
     if latex:
-        return [f"$|{b}\\rangle$" for b in generate_bitstrings(k)]
+        return tuple(f"$|{b}\\rangle$" for b in generate_bitstrings(k))
     else:
-        return [f"|{b}>" for b in generate_bitstrings(k)]
+        return tuple(f"|{b}>" for b in generate_bitstrings(k))
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -151,22 +580,59 @@ def largest_remainder_rounding(fractions: FloatArray, total: int) -> list[int]:
     Code derived from https://stackoverflow.com/q/25271388
     """
     fractions = np.asarray(fractions)
-    unround_numbers = (fractions / fractions.sum()) * total
-    decimal_part_with_index = sorted(
-        [(index, unround_numbers[index] % 1) for index in range(len(unround_numbers))], key=lambda y: y[1], reverse=True
-    )
-    remainder = total - sum(unround_numbers.astype(int))
-    index = 0
-    while remainder > 0:
-        unround_numbers[decimal_part_with_index[index][0]] += 1
-        remainder -= 1
-        index = (index + 1) % fractions.size
-    return [int(x) for x in unround_numbers]
+    return largest_remainder_rounding_batch(fractions.reshape(1, -1), total)[0].tolist()
+
+
+def largest_remainder_rounding_batch(fractions: FloatArray, total: int | IntArrayLike) -> IntArray:
+    """Largest remainder rounding algorithm for each row of a 2-dimensional array
+
+    The remainders to round up are selected with `np.partition`, so the cost is linear in the number of outcomes.
+    For equal remainders the outcome with the lowest index is rounded up first. Rows with zero sum are rounded to zero.
+
+    Args:
+        fractions: Array of shape ``(number_of_histograms, number_of_outcomes)``
+        total: Total for all rows, or an array with the total for each row
+    Returns:
+        Integer array of the same shape as the input with rows adding up to the total
+    """
+    fractions = np.asarray(fractions, dtype=float)
+    number_of_rows, number_of_columns = fractions.shape
+    total = np.broadcast_to(np.asarray(total, dtype=np.int64), (number_of_rows,))
+
+    row_sums = fractions.sum(axis=1, keepdims=True)
+    unround_numbers = (fractions / np.where(row_sums == 0, 1, row_sums)) * total[:, np.newaxis]
+    rounded = unround_numbers.astype(np.int64)
+    remainders = unround_numbers - rounded
+    number_to_add = np.where(row_sums[:, 0] == 0, 0, np.clip(total - rounded.sum(axis=1), 0, number_of_columns))
+
+    maximum_to_add = int(number_to_add.max(initial=0))
+    if maximum_to_add > 0:
+        largest = -np.partition(-remainders, maximum_to_add - 1, axis=1)[:, :maximum_to_add]
+        largest = -np.sort(-largest, axis=1)
+        threshold = np.where(
+            number_to_add > 0, largest[np.arange(number_of_rows), np.maximum(number_to_add - 1, 0)], np.inf
+        )
+        larger = remainders > threshold[:, np.newaxis]
+        equal = remainders == threshold[:, np.newaxis]
+        number_of_equal_to_add = number_to_add - larger.sum(axis=1)
+        rounded += larger | (equal & (np.cumsum(equal, axis=1) <= number_of_equal_to_add[:, np.newaxis]))
+    return rounded
 
 
 def fractions2counts(
-    f: list[CountsType] | CountsType, number_of_shots: int, integer_rounding: bool = True
-) -> list[CountsType] | CountsType:
+    f: list[CountsType] | CountsType | CountsArray, number_of_shots: int, integer_rounding: bool = True
+) -> list[CountsType] | CountsType | CountsArray:
+    """Convert fractions to counts
+
+    For a list of fractions with integer rounding all histograms are rounded with a single call
+    to `largest_remainder_rounding_batch`.
+    """
+    if isinstance(f, CountsArray):
+        if integer_rounding:
+            counts = np.array(largest_remainder_rounding(f.counts, number_of_shots), dtype=np.int64)
+        else:
+            counts = number_of_shots * f.counts
+        return CountsArray(f.indices, counts, f.number_of_bits)
     if integer_rounding is True:
 
         def f2c(x, number_of_shots: int):
@@ -180,7 +646,27 @@ def fractions2counts(
 
     if isinstance(f, dict):
         return f2c(f, number_of_shots)
-    return [f2c(x, number_of_shots) for x in f]
+    if integer_rounding is True:
+        sizes = [len(x) for x in f]
+        fractions = np.zeros((len(f), max(sizes, default=0)))
+        for row, x in enumerate(f):
+            if isinstance(x, CountsArray):
+                fractions[row, : sizes[row]] = x.counts
+            else:
+                fractions[row, : sizes[row]] = np.fromiter(x.values(), float, count=sizes[row])
+        counts = largest_remainder_rounding_batch(fractions, number_of_shots)
+        return [
+            CountsArray(x.indices, row[:size], x.number_of_bits)
+            if isinstance(x, CountsArray)
+            else dict(zip(x.keys(), row.tolist()))
+            for x, row, size in zip(f, counts, sizes)
+        ]
+    return [
+        fractions2counts(x, number_of_shots, integer_rounding=False)
+        if isinstance(x, CountsArray)
+        else f2c(x, number_of_shots)
+        for x in f
+    ]
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -194,6 +680,10 @@ if __name__ == "__main__":  # pragma: no cover
     assert fractions2counts(fractions, 1024) == {0: 103, 1: 823, 2: 98}
 
 
+@overload
+def counts2fractions(counts: CountsArray) -> CountsArray: ...
+
+
 @overload
 def counts2fractions(counts: CountsType) -> FractionsType: ...
 
@@ -207,9 +697,12 @@ def counts2fractions(counts: Sequence[CountsType | FractionsType]) -> list[Fract
 
 
 def counts2fractions(
-    counts: CountsType | FractionsType | Sequence[CountsType | FractionsType],
-) -> FractionsType | list[FractionsType]:
+    counts: CountsType | FractionsType | CountsArray | Sequence[CountsType | FractionsType],
+) -> FractionsType | CountsArray | list[FractionsType]:
     """Convert list of counts to list of fractions"""
+    if isinstance(counts, CountsArray):
+        total = counts.total() or 1
+        return CountsArray(counts.indices, counts.counts / total, counts.number_of_bits)
     if isinstance(counts, Sequence):
         return [counts2fractions(c) for c in counts]  # ty: ignore
     total = sum(counts.values())
@@ -225,24 +718,110 @@ def normalize_probability(probabilities: FloatArray) -> FloatArray:
     return w
 
 
-def counts2dense(c: CountsType, number_of_bits: int) -> np.ndarray:
-    """Convert dictionary with fractions or counts to a dense array"""
-    d = np.zeros(2**number_of_bits, dtype=np.array(sum(c.values())).dtype)
-    for k, v in c.items():
-        idx = int(k.replace(" ", ""), base=2)
-        d[idx] = v
+def counts2dense(
+    c: CountsType | CountsArray, number_of_bits: int, *, filename: str | os.PathLike | None = None
+) -> np.ndarray:
+    """Convert dictionary with fractions or counts to a dense array
+
+    Only the observed outcomes are written to the (zero initialized) dense array.
+
+    Args:
+        c: Counts or fractions
+        number_of_bits: Number of bits. The dense array has size 2**number_of_bits
+        filename: If not None, store the dense array in a memory-mapped ``.npy`` file. This is required
+            for more than `MAXIMUM_DENSE_NUMBER_OF_BITS` bits.
+    Returns:
+        Dense array with counts or fractions
+    """
+    if isinstance(c, CountsArray):
+        indices, values = c.indices, c.counts
+        dtype = c.counts.dtype
+    else:
+        indices = bitstrings2indices(list(c))
+        values = np.array(list(c.values()))
+        dtype = np.array(sum(c.values())).dtype
+
+    if filename is None:
+        if number_of_bits > MAXIMUM_DENSE_NUMBER_OF_BITS:
+            raise ValueError(
+                f"dense array for {number_of_bits} bits does not fit in memory, use the filename argument"
+                " for a memory-mapped array or use CountsArray"
+            )
+        d = np.zeros(2**number_of_bits, dtype=dtype)
+    else:
+        d = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=(2**number_of_bits,))
+    d[indices] = values
+    return d
+
+
+def _flatten_counts_batch(counts: Sequence[CountsType | CountsArray]) -> tuple[IntArray, IntArray, np.ndarray]:
+    """Convert a list of counts to arrays with histogram numbers, outcome indices and values
+
+    The keys of all histograms are parsed with a single call to `bitstrings2indices`.
+    """
+    keys = [list(c) for c in counts if not isinstance(c, CountsArray)]
+    parsed_keys = bitstrings2indices(list(itertools.chain.from_iterable(keys)))
+    key_indices = iter(np.split(parsed_keys, np.cumsum([len(k) for k in keys])))
+    indices = [c.indices if isinstance(c, CountsArray) else next(key_indices) for c in counts]
+    values = [c.counts if isinstance(c, CountsArray) else np.array(list(c.values())) for c in counts]
+
+    rows = np.repeat(np.arange(len(counts)), [len(idx) for idx in indices])
+    outcomes = np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64)
+    nonzero_values = [v for v in values if v.size]
+    data = np.concatenate(nonzero_values) if nonzero_values else np.zeros(0, dtype=np.int64)
+    return rows, outcomes, data
+
+
+def counts2dense_batch(
+    counts: Sequence[CountsType | CountsArray], number_of_bits: int, *, sparse: bool = False
+) -> np.ndarray | Any:
+    """Convert a list of dictionaries with fractions or counts to a 2-dimensional array
+
+    Args:
+        counts: Sequence of counts or fractions
+        number_of_bits: Number of bits
+        sparse: If True, return a `scipy.sparse.csr_array`. This is suitable for wide registers
+    Returns:
+        Array of shape ``(len(counts), 2**number_of_bits)``
+    """
+    rows, columns, data = _flatten_counts_batch(counts)
+    shape = (len(counts), 2**number_of_bits)
+
+    if sparse:
+        import scipy.sparse  # lazy import
+
+        return scipy.sparse.csr_array((data, (rows, columns)), shape=shape)
+
+    if number_of_bits > MAXIMUM_DENSE_NUMBER_OF_BITS:
+        raise ValueError(f"dense array for {number_of_bits} bits does not fit in memory, use sparse=True")
+    d = np.zeros(shape, dtype=data.dtype)
+    d[rows, columns] = data
     return d
 
 
-def dense2sparse(d: IntArray) -> CountsType:
-    """Convert a dense array to a sparse counts dictionary"""
+@overload
+def dense2sparse(d: IntArray, counts_array: Literal[False] = False) -> CountsType: ...
+
+
+@overload
+def dense2sparse(d: IntArray, counts_array: Literal[True]) -> CountsArray: ...
+
+
+def dense2sparse(d: IntArray, counts_array: bool = False) -> CountsType | CountsArray:
+    """Convert a dense array to a sparse counts dictionary
+
+    Only the bitstrings of the nonzero elements are formatted, so the array can be memory-mapped.
+
+    Args:
+        d: Dense array of length 2**number_of_bits
+        counts_array: If True, return a CountsArray instead of a dictionary
+    """
+    if counts_array:
+        return CountsArray.from_dense(d)
     d = np.asanyarray(d)
     number_of_bits = int(np.log2(d.size))
-    fmt = f"{{:0{number_of_bits}b}}"
-    bb = [fmt.format(idx) for idx in range(2**number_of_bits)]
-    counts = {bitstring: d[idx].item() for idx, bitstring in enumerate(bb)}
-    counts = {key: value for key, value in counts.items() if value}
-    return counts
+    indices = np.flatnonzero(d)
+    return dict(zip(indices2bitstrings(indices, number_of_bits), d.reshape(-1)[indices].tolist()))
 
 
 def normalize_fractions(f: FloatArray) -> FloatArray:
@@ -251,18 +830,357 @@ def normalize_fractions(f: FloatArray) -> FloatArray:
     return f / sum(f)
 
 
+def _bootstrap_block(
+    counts: Sequence[CountsType | CountsArray], number_of_samples: int, rng: np.random.Generator
+) -> tuple[IntArray, IntArray]:
+    rows, indices, data = _flatten_counts_batch(counts)
+    if data.dtype.kind not in "iu" and np.any(data != np.round(data)):
+        raise ValueError("bootstrap resampling requires integer counts")
+    outcomes, columns = np.unique(indices, return_inverse=True)
+    histograms = np.zeros((len(counts), outcomes.size), dtype=np.int64)
+    np.add.at(histograms, (rows, columns), data.astype(np.int64))
+
+    totals = histograms.sum(axis=1)
+    probabilities = histograms / np.where(totals == 0, 1, totals)[:, np.newaxis]
+    probabilities[totals == 0, 0:1] = 1  # histograms without counts are resampled without counts
+    if outcomes.size == 0:
+        return outcomes, np.zeros((len(counts), number_of_samples, 0), dtype=np.int64)
+    resampled_counts = rng.multinomial(
+        totals[:, np.newaxis], probabilities[:, np.newaxis, :], size=(len(counts), number_of_samples)
+    )
+    return outcomes, resampled_counts
+
+
+def bootstrap_counts(
+    counts: Sequence[CountsType | CountsArray],
+    number_of_samples: int = 1000,
+    *,
+    statistic: Callable[[IntArray, IntArray], Any] | None = None,
+    seed: int | np.random.Generator | None = None,
+    block_size: int | None = None,
+) -> tuple[IntArray, IntArray] | Any:
+    """Draw bootstrap resamples of a list of histograms
+
+    The resamples are drawn with a single call to `np.random.Generator.multinomial` per block of histograms. The
+    resampled counts of a block are represented on the union of the observed outcomes of the histograms in the block,
+    so they require ``block_size * number_of_samples * number_of_outcomes`` integers. For many histograms with
+    different outcomes, use a statistic together with a small block size.
+
+    Args:
+        counts: Sequence of histograms with integer counts
+        number_of_samples: Number of resamples for each histogram
+        statistic: If not None, a vectorized function that is applied to the outcomes and the resampled counts.
+            The function is called as ``statistic(outcomes, resampled_counts)`` and should return an array with the
+            histograms along the first axis. The results for all histograms are returned
+        seed: Seed or generator for the random number generator
+        block_size: If not None, the number of histograms that are resampled at once. Requires a statistic
+    Returns:
+        Tuple with the outcome indices of shape ``(number_of_outcomes,)`` and the resampled counts of shape
+        ``(len(counts), number_of_samples, number_of_outcomes)``, or the result of the statistic
+
+    Example:
+        >>> def expectation_z0(outcomes, resampled_counts):
+        ...     return resampled_counts @ (1 - 2 * (outcomes & 1)) / resampled_counts.sum(axis=-1)
+        >>> values = bootstrap_counts([{"00": 80, "01": 20}], 100, statistic=expectation_z0, seed=1)
+        >>> values.shape
+        (1, 100)
+    """
+    rng = np.random.default_rng(seed)
+    if block_size is None:
+        outcomes, resampled_counts = _bootstrap_block(counts, number_of_samples, rng)
+        if statistic is None:
+            return outcomes, resampled_counts
+        return statistic(outcomes, resampled_counts)
+
+    if statistic is None:
+        raise ValueError("block_size requires a statistic")
+    if block_size < 1:
+        raise ValueError(f"block_size {block_size} should be positive")
+    results = [
+        statistic(*_bootstrap_block(counts[start : start + block_size], number_of_samples, rng))
+        for start in range(0, len(counts), block_size)
+    ]
+    if not results:
+        return statistic(*_bootstrap_block(counts, number_of_samples, rng))
+    return np.concatenate(results, axis=0)
+
+
+# %% Readout mitigation
+
+
+class TensoredReadoutMitigator:
+    """Readout error mitigation with a tensor product of assignment matrices
+
+    The assignment matrix of each group of qubits has elements ``A[measured, prepared]``. The inverse of the full
+    assignment matrix is never constructed: the inverses of the group matrices are applied one at a time to the
+    corresponding tensor axes of the probability vector.
+    """
+
+    def __init__(
+        self,
+        assignment_matrices: Sequence[np.typing.ArrayLike],
+        qubits: Sequence[Sequence[int]] | None = None,
+        number_of_bits: int | None = None,
+    ) -> None:
+        """
+        Args:
+            assignment_matrices: For each group of k qubits an assignment matrix of shape (2**k, 2**k)
+            qubits: For each group the qubits it acts on. Bit ``j`` of the matrix index corresponds to qubit
+                ``qubits[g][j]`` (LSB index zero). If None, the groups act on consecutive qubits starting at zero
+            number_of_bits: Number of bits of the outcomes. Bits not in any group are not mitigated.
+                If None, use the largest qubit index plus one
+        """
+        matrices = [np.asarray(a, dtype=float) for a in assignment_matrices]
+        group_sizes = [int(np.log2(a.shape[0])) for a in matrices]
+        for a, size in zip(matrices, group_sizes):
+            if a.shape != (2**size, 2**size):
+                raise ValueError(f"assignment matrix of shape {a.shape} is not valid")
+        if qubits is None:
+            offsets = np.cumsum([0] + group_sizes)
+            qubits = [tuple(range(offsets[ii], offsets[ii + 1])) for ii in range(len(matrices))]
+        qubits = [tuple(int(q) for q in group) for group in qubits]
+        if [len(group) for group in qubits] != group_sizes:
+            raise ValueError("number of qubits does not match the size of the assignment matrices")
+        all_qubits = list(itertools.chain.from_iterable(qubits))
+        if len(set(all_qubits)) != len(all_qubits):
+            raise ValueError(f"qubits {qubits} are not unique")
+        if number_of_bits is None:
+            number_of_bits = max(all_qubits, default=-1) + 1
+        if any(not 0 <= q < number_of_bits for q in all_qubits):
+            raise ValueError(f"qubits {qubits} invalid for {number_of_bits} bits")
+
+        self.number_of_bits = number_of_bits
+        self.qubits = qubits
+        self.assignment_matrices = matrices
+        self.inverse_matrices = [np.linalg.inv(a) for a in matrices]
+
+    def mitigate_dense(self, probabilities: FloatArray) -> FloatArray:
+        """Apply the inverse assignment matrix to dense probability vectors
+
+        Args:
+            probabilities: Array of shape ``(2**number_of_bits,)`` or ``(number_of_histograms, 2**number_of_bits)``
+        Returns:
+            Mitigated quasi-probabilities with the same shape as the input
+        """
+        probabilities = np.asarray(probabilities, dtype=float)
+        n = self.number_of_bits
+        tensor = probabilities.reshape((-1,) + (2,) * n)
+        for inverse, group in zip(self.inverse_matrices, self.qubits):
+            k = len(group)
+            # axes of the tensor for bits k-1, ..., 0 of the group; axis 0 is the histogram axis
+            tensor_axes = [1 + n - 1 - group[j] for j in reversed(range(k))]
+            tensor = np.tensordot(inverse.reshape((2,) * (2 * k)), tensor, axes=(list(range(k, 2 * k)), tensor_axes))
+            tensor = np.moveaxis(tensor, list(range(k)), tensor_axes)
+        return tensor.reshape(probabilities.shape)
+
+    def mitigate_counts(self, counts: Sequence[CountsType | CountsArray]) -> FloatArray:
+        """Mitigate a list of counts
+
+        Returns:
+            Array of shape ``(len(counts), 2**number_of_bits)`` with quasi-probabilities
+        """
+        d = counts2dense_batch(counts, self.number_of_bits).astype(float)
+        totals = d.sum(axis=1, keepdims=True)
+        return self.mitigate_dense(d / np.where(totals == 0, 1, totals))
+
+    def mitigate_counts_sparse(
+        self, counts: Sequence[CountsType | CountsArray], block_size: int = 1024
+    ) -> list[CountsArray]:
+        """Mitigate a list of counts, only evaluating the observed outcomes
+
+        The quasi-probabilities of the observed outcomes are exact, since the unobserved outcomes have zero
+        probability. The cost scales quadratically with the number of observed outcomes per histogram.
+
+        Args:
+            counts: Sequence of counts
+            block_size: Number of rows of the inverse assignment matrix to construct at once
+        Returns:
+            List with quasi-probabilities for the observed outcomes
+        """
+        covered_mask = sum(1 << q for group in self.qubits for q in group)
+        results = []
+        for c in counts:
+            c = c if isinstance(c, CountsArray) else CountsArray.from_dict(c, self.number_of_bits)
+            probabilities = c.counts / (c.total() or 1)
+            group_indices = [select_bits_array(c.indices, group) for group in self.qubits]
+            # the inverse assignment matrix is the identity on the bits not in any group
+            uncovered_indices = c.indices & ~covered_mask
+            quasi_probabilities = np.empty(len(c))
+            for start in range(0, len(c), block_size):
+                block = np.ones((min(block_size, len(c) - start), len(c)))
+                block *= uncovered_indices[start : start + block_size, np.newaxis] == uncovered_indices[np.newaxis, :]
+                for inverse, indices in zip(self.inverse_matrices, group_indices):
+                    block *= inverse[indices[start : start + block_size, np.newaxis], indices[np.newaxis, :]]
+                quasi_probabilities[start : start + block.shape[0]] = block @ probabilities
+            results.append(CountsArray(c.indices, quasi_probabilities, c.number_of_bits))
+        return results
+
+
 def circuit2matrix(circuit: QuantumCircuit, decimals: int | None = 5) -> ComplexArray:
     """Deprecated: use circuit_to_matrix instead"""
     return circuit_to_matrix(circuit, decimals)
 
 
 def circuit_to_matrix(circuit: QuantumCircuit, decimals: int | None = 5) -> ComplexArray:
-    op = qi.Operator(circuit)
-    U = op.data
+    return circuits_to_matrices([circuit], decimals)[0]
+
+
+@lru_cache
+def _standard_gate_mapping() -> dict[str, Instruction]:
+    return qiskit.circuit.library.get_standard_gate_name_mapping()
+
+
+@lru_cache(maxsize=4096)
+def _standard_gate_matrix(name: str, params: tuple[float, ...]) -> ComplexArray:
+    """Return (read-only) matrix of a standard gate"""
+    gate = _standard_gate_mapping()[name]
+    matrix = gate.base_class(*params).to_matrix() if params else gate.to_matrix()
+    matrix.setflags(write=False)
+    return matrix
+
+
+def _rx_matrices(theta: FloatArray) -> ComplexArray:
+    c, s = np.cos(theta / 2), -1j * np.sin(theta / 2)
+    return np.stack([c, s, s, c], axis=-1).reshape(-1, 2, 2)
+
+
+def _ry_matrices(theta: FloatArray) -> ComplexArray:
+    c, s = np.cos(theta / 2), np.sin(theta / 2)
+    return np.stack([c, -s, s, c], axis=-1).reshape(-1, 2, 2).astype(complex)
+
+
+def _rz_matrices(phi: FloatArray) -> ComplexArray:
+    z = np.zeros_like(phi)
+    return np.stack([np.exp(-0.5j * phi), z, z, np.exp(0.5j * phi)], axis=-1).reshape(-1, 2, 2)
+
+
+def _phase_matrices(lam: FloatArray) -> ComplexArray:
+    o, z = np.ones_like(lam), np.zeros_like(lam)
+    return np.stack([o, z, z, np.exp(1j * lam)], axis=-1).reshape(-1, 2, 2)
+
+
+def _u_matrices(theta: FloatArray, phi: FloatArray, lam: FloatArray) -> ComplexArray:
+    c, s = np.cos(theta / 2), np.sin(theta / 2)
+    matrices = [c, -np.exp(1j * lam) * s, np.exp(1j * phi) * s, np.exp(1j * (phi + lam)) * c]
+    return np.stack(matrices, axis=-1).reshape(-1, 2, 2)
+
+
+# vectorized construction of the matrices of parameterized standard gates for a batch of parameter values
+_batched_gate_matrices: dict[str, Callable[..., ComplexArray]] = {
+    "rx": _rx_matrices,
+    "ry": _ry_matrices,
+    "rz": _rz_matrices,
+    "p": _phase_matrices,
+    "u1": _phase_matrices,
+    "u": _u_matrices,
+    "u3": _u_matrices,
+}
+
+
+def _standard_gate_matrices(name: str, params: FloatArray) -> tuple[ComplexArray, bool]:
+    """Return matrices of a standard gate for a batch of parameter values
+
+    Args:
+        name: Name of the gate
+        params: Array of shape (batch, number of parameters)
+    Returns:
+        Tuple with the matrices and a boolean indicating whether there is a matrix for every element of the batch.
+        If all parameter values are equal, a single matrix is returned.
+    """
+    if params.shape[1] == 0 or np.all(params == params[0]):
+        return _standard_gate_matrix(name, tuple(params[0].tolist())), False
+    if name in _batched_gate_matrices:
+        return _batched_gate_matrices[name](*params.T), True
+    return np.stack([_standard_gate_matrix(name, tuple(row)) for row in params.tolist()]), True
+
+
+def _apply_matrices(
+    unitaries: ComplexArray, matrices: ComplexArray, axes: Sequence[int], batched: bool
+) -> ComplexArray:
+    """Apply matrices to the specified (output) axes of a batch of unitaries
+
+    Args:
+        unitaries: Array of shape (batch, 2, ..., 2, 2**n) with an axis for each qubit
+        matrices: Array of shape (batch, 2**k, 2**k) if batched else (2**k, 2**k)
+        axes: Axes of the unitaries corresponding to the qubits the matrices act on (most significant first)
+        batched: Whether there is a matrix for every element of the batch
+    """
+    k = len(axes)
+    ndim = unitaries.ndim
+    letters = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    input_indices = list(letters[:ndim])
+    output_letters = letters[ndim : ndim + k]
+    output_indices = input_indices.copy()
+    for axis, letter in zip(axes, output_letters):
+        output_indices[axis] = letter
+    gate_indices = output_letters + "".join(input_indices[axis] for axis in axes)
+    tensor = matrices.reshape(matrices.shape[:-2] + (2,) * (2 * k))
+    if batched:
+        gate_indices = input_indices[0] + gate_indices
+    subscripts = f"{gate_indices},{''.join(input_indices)}->{''.join(output_indices)}"
+    return np.einsum(subscripts, tensor, unitaries)
+
+
+def _circuits_to_matrices_same_structure(circuits: Sequence[QuantumCircuit]) -> ComplexArray:
+    number_of_qubits = circuits[0].num_qubits
+    dimension = 2**number_of_qubits
+    batch_size = len(circuits)
+    unitaries = np.broadcast_to(np.eye(dimension, dtype=complex), (batch_size, dimension, dimension))
+    unitaries = unitaries.reshape((batch_size,) + (2,) * number_of_qubits + (dimension,))
+
+    qubit_indices = {qubit: index for index, qubit in enumerate(circuits[0].qubits)}
+    circuit_data = [circuit.data for circuit in circuits]
+    for position, instruction in enumerate(circuit_data[0]):
+        instructions = [data[position] for data in circuit_data]
+        if instruction.is_standard_gate():
+            params = np.array([[float(p) for p in inst.params] for inst in instructions]).reshape(batch_size, -1)
+            matrices, batched = _standard_gate_matrices(instruction.name, params)
+        elif instruction.name in ("barrier", "delay"):
+            continue
+        else:
+            matrices, batched = np.stack([qi.Operator(inst.operation).data for inst in instructions]), True
+        # qubit q corresponds to axis n - q of the unitaries (axis 0 is the batch axis)
+        axes = [number_of_qubits - qubit_indices[q] for q in reversed(instruction.qubits)]
+        unitaries = _apply_matrices(unitaries, matrices, axes, batched=batched)
+
+    phases = np.exp(1j * np.array([float(circuit.global_phase) for circuit in circuits]))
+    return phases[:, None, None] * unitaries.reshape(batch_size, dimension, dimension)
+
+
+def circuits_to_matrices(circuits: Sequence[QuantumCircuit], decimals: int | None = 5) -> ComplexArray:
+    """Return the unitary matrices of a batch of circuits
+
+    The matrices of the standard gates are cached on gate name and parameter values. Each gate is contracted
+    directly into the unitary on the axes of the qubits the gate acts on. Circuits that share a structure (the same
+    gates on the same qubits, but possibly different parameter values) are contracted together.
+
+    Args:
+        circuits: Circuits with the same number of qubits
+        decimals: If not None, the matrices are converted to real if all matrices are close to real, and
+            rounded to the specified number of decimals
+    Returns:
+        Array of shape (number of circuits, 2**number_of_qubits, 2**number_of_qubits)
+    """
+    number_of_qubits = {circuit.num_qubits for circuit in circuits}
+    if len(number_of_qubits) > 1:
+        raise ValueError(f"circuits should have the same number of qubits, got {sorted(number_of_qubits)}")
+    dimension = 2 ** number_of_qubits.pop() if circuits else 1
+    unitaries = np.zeros((len(circuits), dimension, dimension), dtype=complex)
+
+    groups: dict[tuple, list[int]] = {}
+    for index, circuit in enumerate(circuits):
+        qubit_indices = {qubit: idx for idx, qubit in enumerate(circuit.qubits)}
+        structure = tuple(
+            (instruction.name, tuple([qubit_indices[q] for q in instruction.qubits])) for instruction in circuit.data
+        )
+        groups.setdefault(structure, []).append(index)
+    for indices in groups.values():
+        unitaries[indices] = _circuits_to_matrices_same_structure([circuits[index] for index in indices])
+
     if decimals is not None:
-        U = np.real_if_close(U)
-        U = np.round(U, decimals=decimals)
-    return U
+        unitaries = np.real_if_close(unitaries)
+        unitaries = np.round(unitaries, decimals=decimals)
+    return unitaries
 
 
 def random_clifford_circuit(number_of_qubits: int) -> tuple[QuantumCircuit, int]:
@@ -281,34 +1199,264 @@ def random_clifford_circuit(number_of_qubits: int) -> tuple[QuantumCircuit, int]
     return state, cl_index
 
 
+_number_of_cliffords = {1: 24, 2: 11520}
+
+
+def _number_of_clifford_gates(number_of_qubits: int) -> int:
+    if number_of_qubits not in _number_of_cliffords:
+        raise NotImplementedError(f"number_of_qubits {number_of_qubits}")
+    return _number_of_cliffords[number_of_qubits]
+
+
+def _clifford_circuit(number_of_qubits: int, index: int) -> QuantumCircuit:
+    """Return the (cached) circuit of a Clifford gate from `CliffordUtils`"""
+    if number_of_qubits == 1:
+        return CliffordUtils.clifford_1_qubit_circuit(index)
+    return CliffordUtils.clifford_2_qubit_circuit(index)
+
+
+def random_clifford_circuits(
+    number_of_qubits: int, count: int, seed: int | np.random.Generator | None = None
+) -> tuple[list[QuantumCircuit], IntArray]:
+    """Generate circuits for random Clifford gates
+
+    The circuits of the Clifford gates are cached by `CliffordUtils`, so the circuits returned are shared between
+    calls and should not be modified (use `QuantumCircuit.copy` to obtain a modifiable circuit).
+
+    Args:
+        number_of_qubits: Number of qubits, either 1 or 2
+        count: Number of circuits to generate
+        seed: Seed or generator for the random number generator
+    Returns:
+        Tuple with the circuits and the indices of the Clifford gates
+    """
+    number_of_cliffords = _number_of_clifford_gates(number_of_qubits)
+    rng = np.random.default_rng(seed)
+    indices = rng.integers(number_of_cliffords, size=count)
+    circuits = [_clifford_circuit(number_of_qubits, index) for index in indices.tolist()]
+    return circuits, indices
+
+
+def _pauli_product_exponent(x1: IntArray, z1: IntArray, x2: IntArray, z2: IntArray) -> IntArray:
+    """Return exponent g such that P(x1, z1) P(x2, z2) = i^g P(x1 ^ x2, z1 ^ z2) for single-qubit Paulis"""
+    return (x1 & z1) * (z2 - x2) + (x1 & (1 - z1)) * z2 * (2 * x2 - 1) + ((1 - x1) & z1) * x2 * (1 - 2 * z2)
+
+
+def _compose_tableaux(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """Return the tableaux of the Cliffords obtained by applying first and then second
+
+    The tableaux have shape (..., 2n, 2n + 1) and the layout of `qiskit.quantum_info.Clifford.tableau`: row j < n
+    contains the image of X_j and row n + j the image of Z_j, with columns for the X bits, the Z bits and the sign.
+    """
+    n = first.shape[-1] // 2
+    a = first[..., : 2 * n].astype(np.int64)
+    b = second.astype(np.int64)
+    x = np.zeros(a.shape[:-1] + (n,), dtype=np.int64)
+    z = np.zeros_like(x)
+    sign = first[..., 2 * n].astype(np.int64)
+    # the images of the Paulis under the first Clifford are products of X_j and Z_j, with a factor i for each Y
+    exponent = np.sum(a[..., :n] & a[..., n:], axis=-1)
+    for k in range(2 * n):
+        mask = a[..., k]
+        bx, bz = b[..., k, None, :n], b[..., k, None, n : 2 * n]
+        exponent += mask * np.sum(_pauli_product_exponent(x, z, bx, bz), axis=-1)
+        sign += mask * b[..., k, None, 2 * n]
+        x ^= mask[..., None] & bx
+        z ^= mask[..., None] & bz
+    sign = (sign + (exponent % 4) // 2) % 2
+    return np.concatenate([x, z, sign[..., None]], axis=-1).astype(np.uint8)
+
+
+def _inverse_tableaux(tableaux: np.ndarray) -> np.ndarray:
+    """Return the tableaux of the inverses of Cliffords"""
+    n = tableaux.shape[-1] // 2
+    # the inverse of a symplectic matrix S is Omega S^T Omega, with Omega exchanging the X and Z halves
+    permutation = np.r_[n : 2 * n, 0:n]
+    symplectic = np.swapaxes(tableaux[..., : 2 * n], -1, -2)[..., permutation, :][..., permutation]
+    inverse = np.concatenate([symplectic, np.zeros(symplectic.shape[:-1] + (1,), dtype=np.uint8)], axis=-1)
+    # the signs of the product with the unsigned inverse determine the signs of the inverse
+    signs = _compose_tableaux(tableaux, inverse)[..., 2 * n].astype(np.int64)
+    inverse[..., 2 * n] = (symplectic.astype(np.int64) @ signs[..., None])[..., 0] % 2
+    return inverse
+
+
+def _tableau_codes(tableaux: np.ndarray) -> IntArray:
+    bits = tableaux.reshape(tableaux.shape[:-2] + (-1,)).astype(np.int64)
+    return bits @ (1 << np.arange(bits.shape[-1]))
+
+
+@lru_cache
+def _clifford_tableaux(number_of_qubits: int) -> tuple[np.ndarray, IntArray, IntArray]:
+    """Return the tableaux of all Clifford gates, with the sorted codes of the tableaux and the corresponding indices
+
+    The tableaux are computed by composing the tableaux of the gates in the Clifford circuits, for all circuits at once.
+    """
+    number_of_cliffords = _number_of_clifford_gates(number_of_qubits)
+    gate_tableaux = [qi.Clifford(QuantumCircuit(number_of_qubits)).tableau]
+    gate_numbers: dict[tuple[str, tuple[int, ...]], int] = {}
+    sequences = []
+    for index in range(number_of_cliffords):
+        circuit = _clifford_circuit(number_of_qubits, index)
+        qubit_indices = {qubit: idx for idx, qubit in enumerate(circuit.qubits)}
+        sequence = []
+        for instruction in circuit.data:
+            key = (instruction.name, tuple(qubit_indices[q] for q in instruction.qubits))
+            if key not in gate_numbers:
+                gate_numbers[key] = len(gate_tableaux)
+                gate_circuit = QuantumCircuit(number_of_qubits)
+                gate_circuit.append(instruction.operation, key[1])
+                gate_tableaux.append(qi.Clifford(gate_circuit).tableau)
+            sequence.append(gate_numbers[key])
+        sequences.append(sequence)
+
+    gates = np.zeros((number_of_cliffords, max(map(len, sequences))), dtype=np.int64)
+    for index, sequence in enumerate(sequences):
+        gates[index, : len(sequence)] = sequence
+    gate_tableaux_array = np.array(gate_tableaux, dtype=np.uint8)
+    tableaux = np.broadcast_to(gate_tableaux_array[0], (number_of_cliffords,) + gate_tableaux_array.shape[1:])
+    for position in range(gates.shape[1]):
+        tableaux = _compose_tableaux(tableaux, gate_tableaux_array[gates[:, position]])
+
+    codes = _tableau_codes(tableaux)
+    order = np.argsort(codes)
+    return tableaux, codes[order], order
+
+
+def _clifford_indices(number_of_qubits: int, tableaux: np.ndarray) -> IntArray:
+    """Return the indices of the Clifford gates with the specified tableaux"""
+    _, sorted_codes, order = _clifford_tableaux(number_of_qubits)
+    return order[np.searchsorted(sorted_codes, _tableau_codes(tableaux))]
+
+
+def randomized_benchmarking_sequences(
+    number_of_qubits: int,
+    lengths: Sequence[int],
+    seeds: Sequence[int | np.random.Generator],
+    *,
+    output: Literal["circuits", "indices"] = "circuits",
+) -> list[list[QuantumCircuit]] | list[list[IntArray]]:
+    """Generate sequences of random Clifford gates for randomized benchmarking
+
+    For each seed a sequence of random Clifford gates of the maximum length is drawn. The sequence for a length
+    consists of the first Clifford gates of this random sequence, followed by the Clifford gate that inverts them.
+    The inverses are determined by tracking the product of the Clifford gates as a symplectic tableau, for all
+    seeds at once.
+
+    Args:
+        number_of_qubits: Number of qubits, either 1 or 2
+        lengths: Numbers of random Clifford gates in the sequences
+        seeds: Seeds or generators for the random number generator, one for each set of sequences
+        output: If "circuits", return circuits with barriers between the Clifford gates (and without measurements).
+            If "indices", return arrays with the indices of the Clifford gates (see `random_clifford_circuits`)
+    Returns:
+        For each seed a list with the sequence for each of the lengths
+    """
+    if output not in ("circuits", "indices"):
+        raise ValueError(f"output {output} is invalid")
+    lengths = np.asarray(lengths, dtype=np.int64).reshape(-1)
+    if np.any(lengths < 0):
+        raise ValueError(f"lengths {lengths} should be non-negative")
+    tableaux, _, _ = _clifford_tableaux(number_of_qubits)
+    max_length = int(lengths.max(initial=0))
+    indices = np.array([np.random.default_rng(seed).integers(len(tableaux), size=max_length) for seed in seeds])
+    indices = indices.reshape(len(seeds), max_length)
+
+    product = np.broadcast_to(tableaux[0], (len(seeds),) + tableaux.shape[1:])
+    products = np.empty((len(seeds), len(lengths)) + tableaux.shape[1:], dtype=np.uint8)
+    for step in range(max_length + 1):
+        products[:, lengths == step] = product[:, None]
+        if step < max_length:
+            product = _compose_tableaux(product, tableaux[indices[:, step]])
+    inverse_indices = _clifford_indices(number_of_qubits, _inverse_tableaux(products))
+
+    sequences = [
+        [np.append(indices[ii, :length], inverse_indices[ii, jj]) for jj, length in enumerate(lengths.tolist())]
+        for ii in range(len(seeds))
+    ]
+    if output == "indices":
+        return sequences
+
+    def sequence_circuit(sequence: IntArray) -> QuantumCircuit:
+        qc = QuantumCircuit(number_of_qubits)
+        for index in sequence.tolist():
+            qc.compose(_clifford_circuit(number_of_qubits, index), inplace=True)
+            qc.barrier()
+        return qc
+
+    return [[sequence_circuit(sequence) for sequence in seed_sequences] for seed_sequences in sequences]
+
+
 # %%
 
 
+def _named_op_nodes(dag: DAGCircuit, names: Iterable[str]) -> list[DAGOpNode]:
+    """Return the operation nodes of `dag` with one of the specified names
+
+    The passes select candidate nodes by name, since accessing `node.op` creates a Python object for the operation.
+    The type of the operation is only checked for the selected nodes.
+    """
+    return dag.named_nodes(*names)
+
+
+class _RebuiltCachesMixin:
+    """Mixin for passes with caches that are not pickled
+
+    The caches are created by `_initialize_caches` and the attributes in `_cache_attributes` are removed from the
+    pickled state. On unpickling the caches are created again.
+    """
+
+    _cache_attributes: tuple[str, ...] = ()
+
+    def _initialize_caches(self) -> None:
+        raise NotImplementedError
+
+    def __getstate__(self) -> dict[str, Any]:
+        state = self.__dict__.copy()
+        for name in self._cache_attributes:
+            del state[name]
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._initialize_caches()
+
+
 class RemoveGateByName(TransformationPass):
-    """Return a circuit with all gates with specified name removed.
+    """Return a circuit with all gates with specified names removed.
+
+    The number of removed gates for each name is added to the `property_set` of the pass manager under the key
+    "removed_gate_counts".
 
     This transformation is not semantics preserving.
     """
 
-    def __init__(self, gate_name: str, *args: Any, **kwargs: Any):
-        """Remove all gates with specified name from a DAG
+    property_set_key = "removed_gate_counts"
+
+    def __init__(self, gate_name: str | Iterable[str], *args: Any, **kwargs: Any):
+        """Remove all gates with specified names from a DAG
 
         Args:
-            gate_name: Name of the gate to be removed from a DAG
+            gate_name: Name or names of the gates to be removed from a DAG
         """
         super().__init__(*args, **kwargs)
-        self._gate_name = gate_name
+        self._gate_names = frozenset([gate_name] if isinstance(gate_name, str) else gate_name)
 
     def run(self, dag: DAGCircuit) -> DAGCircuit:  # qiskit upstream issue
         """Run the RemoveGateByName pass on `dag`."""
 
-        dag.remove_all_ops_named(self._gate_name)
+        operation_counts = dag.count_ops(recurse=False)
+        removed_gate_counts = dict(self.property_set[self.property_set_key] or {})
+        for name in self._gate_names:
+            if name in operation_counts:
+                dag.remove_all_ops_named(name)
+            removed_gate_counts[name] = removed_gate_counts.get(name, 0) + operation_counts.get(name, 0)
+        self.property_set[self.property_set_key] = removed_gate_counts
 
         return dag
 
     def __repr__(self) -> str:
         name = self.__class__.__module__ + "." + self.__class__.__name__
-        return f"<{name} at 0x{id(self):x}: gate {self._gate_name}"
+        return f"<{name} at 0x{id(self):x}: gates {', '.join(sorted(self._gate_names))}"
 
 
 class RemoveZeroDelayGate(TransformationPass):
@@ -317,59 +1465,117 @@ class RemoveZeroDelayGate(TransformationPass):
     This transformation is not semantics preserving.
     """
 
-    def __init__(self, *args: Any, **kwargs: Any):
-        """Remove all zero duration delay gates from a DAG
-
-        Args:
-            gate_name: Name of the gate to be removed from a DAG
-        """
-        self._empty_dag1 = qiskit.converters.circuit_to_dag(QuantumCircuit(1))
-        super().__init__(*args, **kwargs)
-
     def run(self, dag: DAGCircuit) -> DAGCircuit:  # qiskit upstream issue
         """Run the RemoveZeroDelayGate pass on `dag`."""
 
-        for node in dag.op_nodes():
-            if isinstance(node.op, Delay):
-                if node.op.params[0] == 0:
-                    dag.substitute_node_with_dag(node, self._empty_dag1)
+        for node in _named_op_nodes(dag, ["delay"]):
+            if node.params[0] == 0 and isinstance(node.op, Delay):
+                dag.remove_op_node(node)
         return dag
 
 
-class ReplaceGate(TransformationPass):
+QubitsType = int | Sequence[int] | None
+ReplacementRulesType = Mapping[type[Instruction], QuantumCircuit | tuple[QuantumCircuit, QubitsType]]
+
+
+@dataclass(frozen=True)
+class _ReplacementRule:
+    gate: type[Instruction]
+    replacement_dag: DAGCircuit
+    qubit_set: frozenset[int] | None
+
+    def matches(self, qubits: Iterable[int]) -> bool:
+        return self.qubit_set is None or all(q in self.qubit_set for q in qubits)
+
+
+class ReplaceGate(_RebuiltCachesMixin, TransformationPass):
     def __init__(
         self,
-        gate: type[qiskit.circuit.Gate],
-        replacement_circuit: QuantumCircuit,
-        qubits=None,
+        gate: type[qiskit.circuit.Gate] | ReplacementRulesType,
+        replacement_circuit: QuantumCircuit | None = None,
+        qubits: QubitsType = None,
     ):
-        """Replace selected gate type optionally on selected qubits.
+        """Replace selected gate types optionally on selected qubits.
+
+        All rules are applied in a single sweep over the DAG. If multiple rules match a gate, the first matching rule
+        is applied. The rules are available as the attribute `rules`. The attributes `gate`, `replacement_circuit`,
+        `replacement_dag` and `qubit_set` describe the single rule for a gate type, and are None for a mapping.
 
         Args:
-            gate: gate type to match (e.g. RXGate).
-            replacement_circuit: circuit used to replace each matching instance.
+            gate: gate type to match (e.g. RXGate), or a mapping from gate types to replacement circuits. In the
+                mapping a qubit selection can be specified with a tuple (replacement_circuit, qubits).
+            replacement_circuit: circuit used to replace each matching instance. Required if gate is a gate type.
             qubits: None to replace all matching gates, or int/list of qubit indices to limit replacement.
         """
         super().__init__()
-        self.gate = gate
-        self.replacement_circuit = replacement_circuit
-        self.replacement_dag = circuit_to_dag(self.replacement_circuit)
+        if isinstance(gate, Mapping):
+            if replacement_circuit is not None or qubits is not None:
+                raise ValueError("replacement_circuit and qubits cannot be specified together with a mapping of rules")
+            rules = {
+                gate_type: value if isinstance(value, tuple) else (value, None) for gate_type, value in gate.items()
+            }
+        else:
+            if replacement_circuit is None:
+                raise ValueError(f"no replacement circuit specified for gate {gate.__name__}")
+            rules = {gate: (replacement_circuit, qubits)}
+
+        self.rules = [
+            self._create_rule(gate_type, circuit, rule_qubits) for gate_type, (circuit, rule_qubits) in rules.items()
+        ]
+        self.gate: type[qiskit.circuit.Gate] | None = None
+        self.replacement_circuit: QuantumCircuit | None = None
+        self.replacement_dag: DAGCircuit | None = None
+        self.qubit_set: set[int] | None = None
+        if not isinstance(gate, Mapping):
+            self.gate = gate
+            self.replacement_circuit = replacement_circuit
+            self.replacement_dag = self.rules[0].replacement_dag
+            if self.rules[0].qubit_set is not None:
+                self.qubit_set = set(self.rules[0].qubit_set)
+        self._initialize_caches()
+
+    _cache_attributes = ("_type_rules",)
+
+    def _initialize_caches(self) -> None:
+        self._type_rules: dict[type, tuple[_ReplacementRule, ...]] = {}
 
+    @staticmethod
+    def _create_rule(
+        gate: type[Instruction], replacement_circuit: QuantumCircuit, qubits: QubitsType
+    ) -> _ReplacementRule:
         if qubits is None:
-            self.qubit_set = None
+            qubit_set = None
         elif isinstance(qubits, int):
-            self.qubit_set = {qubits}
+            qubit_set = frozenset({qubits})
         else:
-            self.qubit_set = set(qubits)
+            qubit_set = frozenset(qubits)
+        return _ReplacementRule(gate, circuit_to_dag(replacement_circuit), qubit_set)
+
+    def _rules(self, operation_type: type) -> tuple[_ReplacementRule, ...]:
+        """Return the rules that apply to the specified operation type"""
+        try:
+            return self._type_rules[operation_type]
+        except KeyError:
+            rules = tuple(rule for rule in self.rules if issubclass(operation_type, rule.gate))
+            self._type_rules[operation_type] = rules
+            return rules
 
     def run(self, dag: DAGCircuit) -> DAGCircuit:
         """Run the substitution pass on `dag`."""
-        for node in dag.op_nodes(self.gate):
-            if self.qubit_set is not None:
-                node_qubits = {dag.qubits.index(q) for q in node.qargs}
-                if not node_qubits <= self.qubit_set:
-                    continue
-            dag.substitute_node_with_dag(node, self.replacement_dag)
+        qubit_indices = {qubit: index for index, qubit in enumerate(dag.qubits)}
+        standard_gate_rules: dict[str, tuple[_ReplacementRule, ...]] = {}
+        for node in dag.op_nodes():
+            # the name of a standard gate determines the type, so the rules are looked up once per name
+            if node.is_standard_gate():
+                rules = standard_gate_rules.get(node.name)
+                if rules is None:
+                    rules = standard_gate_rules[node.name] = self._rules(type(node.op))
+            else:
+                rules = self._rules(type(node.op))
+            for rule in rules:
+                if rule.matches(qubit_indices[q] for q in node.qargs):
+                    dag.substitute_node_with_dag(node, rule.replacement_dag)
+                    break
         return dag
 
 
@@ -416,8 +1622,12 @@ def qiskit_experiments_to_figure(
         plt.axis("off")
 
 
-@lru_cache
+@lru_cache(maxsize=1024)
 def delay_gate(duration: float, dt: float, round_dt: bool) -> qiskit.circuit.operation.Operation:
+    """Return delay gate in units of dt for a duration in seconds
+
+    The gates are cached in a bounded cache, use `delay_gate.cache_info()` to inspect the cache.
+    """
     n = duration / dt
     if round_dt:
         n = round(n)
@@ -426,14 +1636,22 @@ def delay_gate(duration: float, dt: float, round_dt: bool) -> qiskit.circuit.ope
 
 
 class ModifyDelayGate(TransformationPass):
-    """Return a circuit with small rotation gates removed."""
+    """Return a circuit with delay gates converted to units of dt."""
+
+    def __init__(self, dt: float = 20e-9, round_dt: bool = True, merge_delays: bool = False) -> None:
+        """Change delay gates to specified time unit
 
-    def __init__(self, dt: float = 20e-9, round_dt: bool = True) -> None:
-        """Change delay gates to specified time unit"""
+        Args:
+            dt: Time unit in seconds
+            round_dt: If True, round the durations to an integer number of time units
+            merge_delays: If True, merge consecutive delays (with unit s or dt) on the same qubit into a single delay.
+                The duration of the merged delay is rounded once
+        """
         super().__init__()
 
         self.round_dt = round_dt
         self.dt = dt
+        self.merge_delays = merge_delays
 
     def run(self, dag: DAGCircuit) -> DAGCircuit:  # qiskit upstream issue
         """Run the pass on `dag`.
@@ -442,7 +1660,10 @@ class ModifyDelayGate(TransformationPass):
         Returns:
             Output dag with Delay gates modified
         """
-        for node in dag.op_nodes():
+        if self.merge_delays:
+            return self._merge_delays(dag)
+
+        for node in _named_op_nodes(dag, ["delay"]):
             if isinstance(node.op, Delay):
                 params = node.op.params
                 if node.op.unit == "s":
@@ -451,6 +1672,41 @@ class ModifyDelayGate(TransformationPass):
                     dag.substitute_node(node, op, inplace=True)
         return dag
 
+    def _delay_duration(self, node: Any) -> float | None:
+        """Return duration of a delay node in units of dt, or None if the node cannot be merged"""
+        if node.name != "delay" or not isinstance(node.op, Delay) or node.is_parameterized():
+            return None
+        match node.op.unit:
+            case "s":
+                return node.op.params[0] / self.dt
+            case "dt":
+                return node.op.params[0]
+            case _:
+                return None
+
+    def _merge_delays(self, dag: DAGCircuit) -> DAGCircuit:
+        for qubit in dag.qubits:
+            runs: list[list[tuple[Any, float]]] = [[]]
+            for node in dag.nodes_on_wire(qubit, only_ops=True):
+                duration = self._delay_duration(node)
+                if duration is None:
+                    if runs[-1]:
+                        runs.append([])
+                else:
+                    runs[-1].append((node, duration))
+
+            for delay_run in runs:
+                if len(delay_run) == 1 and delay_run[0][0].op.unit == "dt":
+                    continue
+                if delay_run:
+                    n = sum(duration for _, duration in delay_run)
+                    if self.round_dt:
+                        n = round(n)
+                    dag.substitute_node(delay_run[0][0], Delay(n, unit="dt"), inplace=True)
+                    for node, _ in delay_run[1:]:
+                        dag.remove_op_node(node)
+        return dag
+
 
 if __name__ == "__main__":  # pragma: no cover
     qc = QuantumCircuit(1)
@@ -461,20 +1717,35 @@ if __name__ == "__main__":  # pragma: no cover
 
 
 def choi_to_unitary(choi: ComplexArray) -> ComplexArray:
-    """Project choi matrix to closest unitary"""
-    n = int(math.log2(choi.shape[0])) // 2
-    bb = [[2] * n, [2] * n]
-    b = [bb] * 2
-    hermitian_choi = (choi + choi.conj().T) / 2  # enforce Hermiticity
-    choi_qobj = Qobj(hermitian_choi, dims=b, superrep="choi")
+    """Project choi matrix to closest unitary
 
-    krauss = qutip.core.superop_reps.to_kraus(choi_qobj)
-    dominant_idx = np.nanargmax([np.abs(np.linalg.det(c.full())) for c in krauss])
-    U = krauss[dominant_idx].full()
+    The Kraus operators of the channel are obtained from an eigendecomposition of the Hermitian part of the choi
+    matrix. The Kraus operator with the largest absolute determinant is selected and the global phase is chosen such
+    that the first element is real and positive.
 
-    phase = np.exp(-np.angle(U[0, 0]) * 1j)
-    U = phase * U
-    return U
+    Args:
+        choi: Choi matrix of shape (d**2, d**2), or an array of shape (batch, d**2, d**2) with choi matrices
+    Returns:
+        Unitary of shape (d, d), or an array of shape (batch, d, d) with unitaries
+    """
+    choi = np.asarray(choi)
+    if choi.ndim == 2:
+        return choi_to_unitary(choi[None])[0]
+    batch_size = choi.shape[0]
+    d = math.isqrt(choi.shape[-1])
+    hermitian_choi = (choi + np.swapaxes(choi.conj(), -1, -2)) / 2  # enforce Hermiticity
+    eigenvalues, eigenvectors = np.linalg.eigh(hermitian_choi)
+
+    # the Kraus operators are the column-stacked eigenvectors scaled by the square root of the eigenvalues
+    kraus = np.swapaxes(eigenvectors, -1, -2).reshape(batch_size, d * d, d, d)
+    kraus = np.sqrt(np.maximum(eigenvalues, 0))[..., None, None] * np.swapaxes(kraus, -1, -2)
+    # eigenvalues below the tolerance (and negative eigenvalues) do not correspond to Kraus operators
+    determinants = np.where(eigenvalues >= 1e-9, np.abs(np.linalg.det(kraus)), np.nan)
+    dominant_idx = np.nanargmax(determinants, axis=-1)
+    U = kraus[np.arange(batch_size), dominant_idx]
+
+    phase = np.exp(-np.angle(U[:, 0, 0]) * 1j)
+    return phase[:, None, None] * U
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -492,6 +1763,114 @@ if __name__ == "__main__":  # pragma: no cover
         IC = np.exp(-np.angle(IC[0, 0]) * 1j) * IC
         np.testing.assert_almost_equal(IC, np.eye(IC.shape[0]))
 
+# %% Fidelity metrics
+
+RepresentationType = Literal["unitary", "choi"]
+
+
+def _column_stacked(matrices: ComplexArray) -> ComplexArray:
+    return np.swapaxes(matrices, -1, -2).reshape(matrices.shape[:-2] + (-1,))
+
+
+def process_fidelity(
+    operators: ComplexArray,
+    targets: ComplexArray,
+    *,
+    representation: RepresentationType = "unitary",
+    pairwise: bool = False,
+) -> FloatArray:
+    """Return the process fidelities of operations with respect to target unitaries
+
+    For unitaries U and V the process fidelity is |Tr(U^dagger V)|^2 / d^2, which does not depend on the global phase
+    of U and V. For a channel with choi matrix C (with trace d) the process fidelity is <<V| C |V>> / d^2, with |V>>
+    the column-stacked vectorization of V.
+
+    Args:
+        operators: Array of shape (..., d, d) with unitaries or (..., d**2, d**2) with choi matrices
+        targets: Array of shape (..., d, d) with the target unitaries
+        representation: Representation of the operators, either "unitary" or "choi"
+        pairwise: If True, compare all operators of shape (N, ...) with all targets of shape (M, ...). If False, the
+            leading dimensions of the operators and targets are broadcast
+    Returns:
+        Array with the process fidelities, of shape (N, M) if pairwise is True
+    """
+    operators = np.asarray(operators)
+    targets = np.asarray(targets)
+    d = targets.shape[-1]
+    vectors = _column_stacked(targets)
+    match representation:
+        case "unitary":
+            if operators.shape[-2:] != targets.shape[-2:]:
+                raise ValueError(
+                    f"shape {operators.shape} of unitaries does not match shape {targets.shape} of targets"
+                )
+            operator_vectors = _column_stacked(operators)
+            if pairwise:
+                overlaps = operator_vectors.conj() @ vectors.T
+            else:
+                overlaps = np.vecdot(operator_vectors, vectors)
+            return np.abs(overlaps / d) ** 2
+        case "choi":
+            if operators.shape[-2:] != (d * d, d * d):
+                raise ValueError(
+                    f"shape {operators.shape} of choi matrices does not match shape {targets.shape} of targets"
+                )
+            if pairwise:
+                overlaps = np.einsum("mi,nim->nm", vectors.conj(), operators @ vectors.T)
+            else:
+                overlaps = np.vecdot(vectors, (operators @ vectors[..., None])[..., 0])
+            return overlaps.real / d**2
+        case _:
+            raise ValueError(f"representation {representation} is invalid")
+
+
+def average_gate_fidelity(
+    operators: ComplexArray,
+    targets: ComplexArray,
+    *,
+    representation: RepresentationType = "unitary",
+    pairwise: bool = False,
+) -> FloatArray:
+    """Return the average gate fidelities of (trace preserving) operations with respect to target unitaries
+
+    The average gate fidelity is (d F + 1) / (d + 1), with F the process fidelity. For the arguments see
+    `process_fidelity`.
+    """
+    d = np.shape(targets)[-1]
+    fidelity = process_fidelity(operators, targets, representation=representation, pairwise=pairwise)
+    return (d * fidelity + 1) / (d + 1)
+
+
+def process_distance(
+    operators: ComplexArray,
+    targets: ComplexArray,
+    *,
+    representation: RepresentationType = "unitary",
+    pairwise: bool = False,
+    metric: Literal["bures", "trace"] = "bures",
+) -> FloatArray:
+    """Return distances of operations to target unitaries, derived from the process fidelity F
+
+    The distances are proxies for the diamond norm distance that do not require solving a semidefinite program.
+
+    * "bures": sqrt(2 - 2 sqrt(F)), the Bures distance between the normalized choi matrices. For unitaries this is
+      min_phi ||U - exp(i phi) V||_F / sqrt(d), the normalized Frobenius distance minimized over the global phase.
+    * "trace": sqrt(1 - F), an upper bound for the trace distance between the normalized choi matrices, which
+      is exact for unitaries.
+
+    For the other arguments see `process_fidelity`.
+    """
+    fidelity = process_fidelity(operators, targets, representation=representation, pairwise=pairwise)
+    fidelity = np.clip(fidelity, 0, 1)
+    match metric:
+        case "bures":
+            return np.sqrt(2 - 2 * np.sqrt(fidelity))
+        case "trace":
+            return np.sqrt(1 - fidelity)
+        case _:
+            raise ValueError(f"metric {metric} is invalid")
+
+
 # %% Vendored from qtt
 
 
@@ -508,8 +1887,6 @@ class RemoveSmallRotations(TransformationPass):
         super().__init__()
 
         self.epsilon = epsilon
-        self._empty_dag1 = circuit_to_dag(QuantumCircuit(1), copy_operations=False)
-        self._empty_dag2 = circuit_to_dag(QuantumCircuit(2), copy_operations=False)
         self.mod2pi = modulo2pi
 
     def run(self, dag: DAGCircuit) -> DAGCircuit:
@@ -520,38 +1897,124 @@ class RemoveSmallRotations(TransformationPass):
             Output dag with small rotations removed
         """
 
-        def modulo_2pi(x: float) -> float:
-            x = float(x)
-            return float(np.mod(x + np.pi, 2 * np.pi) - np.pi)
-
-        for node in dag.op_nodes():
-            if isinstance(node.op, (PhaseGate, RXGate, RYGate, RZGate)):
-                if node.op.is_parameterized():
-                    # for parameterized gates we do not optimize
-                    pass
-                else:
-                    phi = float(node.op.params[0])
-                    if self.mod2pi:
-                        phi = modulo_2pi(phi)
-                    if np.abs(phi) <= self.epsilon:
-                        dag.substitute_node_with_dag(node, self._empty_dag1)
-            elif isinstance(node.op, (CRXGate, CRYGate, CRZGate)):
-                if node.op.is_parameterized():
-                    # for parameterized gates we do not optimize
-                    pass
-                else:
-                    phi = float(node.op.params[0])
-                    if self.mod2pi:
-                        phi = modulo_2pi(phi)
-                    if np.abs(phi) <= self.epsilon:
-                        dag.substitute_node_with_dag(node, self._empty_dag2)
+        nodes = []
+        angles = []
+        for node in _named_op_nodes(dag, self._rotation_names):
+            if node.is_standard_gate() or isinstance(node.op, self._rotation_types):
+                if not node.is_parameterized():  # for parameterized gates we do not optimize
+                    nodes.append(node)
+                    angles.append(float(node.params[0]))
+
+        if nodes:
+            for index in np.flatnonzero(self._is_small_rotation(np.array(angles, dtype=float))):
+                dag.remove_op_node(nodes[index])
         return dag
 
+    def _is_small_rotation(self, angles: Any) -> Any:
+        """Return boolean (mask) indicating the rotation angles that can be removed"""
+        if self.mod2pi:
+            angles = np.mod(angles + np.pi, 2 * np.pi) - np.pi
+        return np.abs(angles) <= self.epsilon
+
+    _rotation_types = (PhaseGate, RXGate, RYGate, RZGate, CRXGate, CRYGate, CRZGate)
+    _rotation_names = frozenset(["p", "rx", "ry", "rz", "crx", "cry", "crz"])
+
+
+class MergeRotations(RemoveSmallRotations):
+    """Return a circuit with runs of same-axis rotations merged and small rotations removed."""
+
+    # rotations that are merged, rotations with the same name on the same qubit have the same axis
+    _merge_gates: dict[str, type[qiskit.circuit.Gate]] = {"rx": RXGate, "ry": RYGate, "rz": RZGate, "p": PhaseGate}
+    _z_rotation_names = frozenset(["rz", "p"])
+    # number of leading qubits of standard gates on which the gate is diagonal, z-rotations on these qubits commute
+    # with the gate
+    _diagonal_qubits = {
+        "cx": 1,
+        "cy": 1,
+        "ch": 1,
+        "csx": 1,
+        "crx": 1,
+        "cry": 1,
+        "crz": 2,
+        "cz": 2,
+        "cp": 2,
+        "cs": 2,
+        "csdg": 2,
+        "ccx": 2,
+        "ccz": 3,
+        "cswap": 1,
+    }
+
+    def __init__(self, epsilon: float = 0, modulo2pi: bool = False) -> None:
+        """Merge runs of rotations around the same axis on each qubit
+
+        Consecutive RX, RY, RZ or Phase gates on a qubit are merged into a single gate. Z-rotations are also
+        merged through the control qubits of controlled gates. After merging all rotations smaller than epsilon
+        are removed, as in RemoveSmallRotations.
+
+        Args:
+            epsilon: Threshold for rotation angle to be removed
+            modulo2pi: If True, then rotations multiples of 2pi are removed as well
+        """
+        super().__init__(epsilon=epsilon, modulo2pi=modulo2pi)
+
+    def _is_mergeable(self, node: Any) -> bool:
+        return node.name in self._merge_gates and node.is_standard_gate() and not node.is_parameterized()
+
+    def _commutes_with_z_rotation(self, node: Any, qubit: Any) -> bool:
+        """Return True if a z-rotation on the qubit commutes with the operation of the node"""
+        number_of_diagonal_qubits = self._diagonal_qubits.get(node.name, 0)
+        return (
+            number_of_diagonal_qubits > 0
+            and node.is_standard_gate()
+            and qubit in node.qargs[:number_of_diagonal_qubits]
+        )
+
+    def _merge(self, dag: DAGCircuit, rotation_run: list[Any]) -> None:
+        if len(rotation_run) > 1:
+            angle = sum(float(node.params[0]) for node in rotation_run)
+            gate = self._merge_gates[rotation_run[0].name](angle)
+            dag.substitute_node(rotation_run[0], gate, inplace=True)
+            for node in rotation_run[1:]:
+                dag.remove_op_node(node)
+
+    def run(self, dag: DAGCircuit) -> DAGCircuit:
+        """Run the pass on `dag`.
+        Args:
+            dag: input dag.
+        Returns:
+            Output dag with rotations merged and small rotations removed
+        """
+        for qubit in dag.qubits:
+            rotation_run: list[Any] = []
+            for node in list(dag.nodes_on_wire(qubit, only_ops=True)):
+                if self._is_mergeable(node):
+                    if rotation_run and rotation_run[0].name == node.name:
+                        rotation_run.append(node)
+                    else:
+                        self._merge(dag, rotation_run)
+                        rotation_run = [node]
+                elif not (
+                    rotation_run
+                    and rotation_run[0].name in self._z_rotation_names
+                    and self._commutes_with_z_rotation(node, qubit)
+                ):
+                    self._merge(dag, rotation_run)
+                    rotation_run = []
+            self._merge(dag, rotation_run)
+
+        return super().run(dag)
+
 
 def _is_numeric_parameter(value: Any) -> bool:
     return isinstance(value, (Real, np.number))
 
 
+def _isclose(a: float, b: float, atol: float) -> bool:
+    """Scalar version of `np.isclose` (with default relative tolerance) without the overhead of numpy"""
+    return abs(a - b) <= atol + 1e-5 * abs(b)
+
+
 def _u2_gate(qc: QuantumCircuit, phi: Any, lam: Any) -> None:
     """Add decomposition of U2 gate to quantum circuit"""
     if _is_numeric_parameter(phi) and _is_numeric_parameter(lam):
@@ -564,15 +2027,15 @@ def _u2_gate(qc: QuantumCircuit, phi: Any, lam: Any) -> None:
     if (
         phi_float is not None
         and lam_float is not None
-        and np.isclose(phi_float, 0.0, atol=1e-12)
-        and np.isclose(lam_float, 0.0, atol=1e-12)
+        and _isclose(phi_float, 0.0, atol=1e-12)
+        and _isclose(lam_float, 0.0, atol=1e-12)
     ):
         qc.ry(np.pi / 2, 0)
     elif (
         phi_float is not None
         and lam_float is not None
-        and np.isclose(np.mod(phi_float + np.pi, 2 * np.pi) - np.pi, -np.pi / 2, atol=1e-12)
-        and np.isclose(np.mod(lam_float + np.pi, 2 * np.pi) - np.pi, np.pi / 2, atol=1e-12)
+        and _isclose(np.mod(phi_float + np.pi, 2 * np.pi) - np.pi, -np.pi / 2, atol=1e-12)
+        and _isclose(np.mod(lam_float + np.pi, 2 * np.pi) - np.pi, np.pi / 2, atol=1e-12)
     ):
         qc.rx(np.pi / 2, 0)
     else:
@@ -581,13 +2044,48 @@ def _u2_gate(qc: QuantumCircuit, phi: Any, lam: Any) -> None:
         qc.rz(phi + np.pi / 2, 0)
 
 
-class DecomposeU(TransformationPass):
-    def __init__(self) -> None:
+class DecomposeU(_RebuiltCachesMixin, TransformationPass):
+    def __init__(self, *, cache_size: int | None = 1024, angle_tolerance: float | None = None) -> None:
         """Decompose U gates into elementary rotations Rx(pi/2), Ry(pi/2), Rz
 
-        The U gates are decomposed using McKay decomposition.
+        The U gates are decomposed using McKay decomposition. The replacement DAGs are cached on the gate parameters,
+        statistics of the cache are available with `cache_info`.
+
+        Args:
+            cache_size: Maximum number of replacement DAGs in the cache. If None, the cache is unbounded
+            angle_tolerance: If not None, numeric angles are rounded to a multiple of the tolerance before
+                decomposition. Nearly identical gates then share a cache entry, at the cost of an error of at most
+                half the tolerance in each angle
         """
         super().__init__()
+        if angle_tolerance is not None and not angle_tolerance > 0:
+            raise ValueError(f"angle_tolerance {angle_tolerance} should be positive")
+        self.cache_size = cache_size
+        self.angle_tolerance = angle_tolerance
+        self._initialize_caches()
+
+    _cache_attributes = ("_replacement_dag",)
+
+    def _initialize_caches(self) -> None:
+        self._replacement_dag = lru_cache(maxsize=self.cache_size)(self._create_replacement_dag)
+
+    def _parameters_key(self, parameters: Sequence[Any]) -> tuple[Any, ...]:
+        """Return the (quantized) parameters used for the decomposition"""
+        if self.angle_tolerance is None:
+            return tuple(parameters)
+        tolerance = self.angle_tolerance
+        return tuple(round(float(p) / tolerance) * tolerance if _is_numeric_parameter(p) else p for p in parameters)
+
+    def _create_replacement_dag(self, parameters: tuple[Any, ...]) -> DAGCircuit:
+        return circuit_to_dag(self._ugate_replacement_circuit(parameters), copy_operations=False)
+
+    def cache_info(self) -> Any:
+        """Return hits, misses, maximum size and current size of the replacement DAG cache"""
+        return self._replacement_dag.cache_info()
+
+    def cache_clear(self) -> None:
+        """Clear the replacement DAG cache"""
+        self._replacement_dag.cache_clear()
 
     @staticmethod
     def _decompose_three_parameter_u(qc: QuantumCircuit, theta: Any, phi: Any, lam: Any) -> None:
@@ -602,23 +2100,23 @@ class DecomposeU(TransformationPass):
             lam_mod = float(np.mod(lam_float + np.pi, 2 * np.pi) - np.pi)
 
             if (
-                np.isclose(theta_mod, np.pi, atol=1e-12)
-                and np.isclose(phi_mod, -np.pi / 2, atol=1e-12)
-                and np.isclose(lam_mod, np.pi / 2, atol=1e-12)
+                _isclose(theta_mod, np.pi, atol=1e-12)
+                and _isclose(phi_mod, -np.pi / 2, atol=1e-12)
+                and _isclose(lam_mod, np.pi / 2, atol=1e-12)
             ):
                 qc.rx(np.pi / 2, 0)
                 qc.rx(np.pi / 2, 0)
                 return
 
-            if np.isclose(theta_mod, np.pi / 2, atol=1e-12):
+            if _isclose(theta_mod, np.pi / 2, atol=1e-12):
                 _u2_gate(qc, phi_float, lam_float)
                 return
 
-            if np.isclose(phi_float, 0.0, atol=1e-12) and np.isclose(lam_float, 0.0, atol=1e-12):
-                if np.isclose(theta_float, -np.pi / 2, atol=1e-12) or np.isclose(theta_mod, 3 * np.pi / 2, atol=1e-12):
+            if _isclose(phi_float, 0.0, atol=1e-12) and _isclose(lam_float, 0.0, atol=1e-12):
+                if _isclose(theta_float, -np.pi / 2, atol=1e-12) or _isclose(theta_mod, 3 * np.pi / 2, atol=1e-12):
                     qc.ry(-np.pi / 2, 0)
                     return
-                if np.isclose(theta_float, np.pi, atol=1e-12) or np.isclose(theta_float, -np.pi, atol=1e-12):
+                if _isclose(theta_float, np.pi, atol=1e-12) or _isclose(theta_float, -np.pi, atol=1e-12):
                     qc.ry(np.pi / 2, 0)
                     qc.ry(np.pi / 2, 0)
                     return
@@ -662,7 +2160,7 @@ class DecomposeU(TransformationPass):
         if not isinstance(ugate, (U3Gate, UGate, U2Gate, U1Gate, PhaseGate)):
             raise TypeError(f"unsupported gate type {type(ugate).__name__}")
 
-        return self._ugate_replacement_circuit(tuple(ugate.params))
+        return self._ugate_replacement_circuit(self._parameters_key(ugate.params))
 
     def run(self, dag: DAGCircuit) -> DAGCircuit:
         """Run the Decompose pass on `dag`.
@@ -674,8 +2172,168 @@ class DecomposeU(TransformationPass):
             Output DAG where ``U`` gates have been decomposed.
         """
         # Walk through the DAG and expand each node if required
-        for node in dag.op_nodes():
-            if isinstance(node.op, (PhaseGate, U1Gate, U2Gate, U3Gate, UGate)):
-                subdag = circuit_to_dag(self.ugate_replacement_circuit(node.op), copy_operations=False)
-                dag.substitute_node_with_dag(node, subdag)
+        for node in _named_op_nodes(dag, self._ugate_names):
+            if node.is_standard_gate() or isinstance(node.op, self._ugate_types):
+                dag.substitute_node_with_dag(node, self._replacement_dag(self._parameters_key(node.params)))
         return dag
+
+    _ugate_types = (PhaseGate, U1Gate, U2Gate, U3Gate, UGate)
+    _ugate_names = frozenset(["p", "u1", "u2", "u3", "u"])
+
+
+def _run_passes_block(circuits: Sequence[QuantumCircuit], passes: Sequence[BasePass]) -> list[QuantumCircuit]:
+    pass_manager = PassManager(list(passes))
+    return pass_manager.run(list(circuits), num_processes=1)
+
+
+def run_passes_parallel(
+    circuits: Sequence[QuantumCircuit],
+    passes: Sequence[BasePass],
+    *,
+    n_jobs: int = -1,
+    block_size: int | None = None,
+) -> list[QuantumCircuit]:
+    """Run transpiler passes on a batch of circuits using a pool of processes
+
+    The circuits are divided into blocks. Each block is processed in a worker process with a `PassManager`
+    containing (unpickled copies of) the passes, so the caches of the passes are rebuilt in the workers.
+
+    Args:
+        circuits: Circuits to transform
+        passes: Transpiler passes to apply to each circuit
+        n_jobs: Number of worker processes, see `joblib.Parallel`
+        block_size: Number of circuits per block. If None, the circuits are divided into 4 blocks per worker
+    Returns:
+        List with the transformed circuits, in the order of the input circuits
+    """
+    from joblib import Parallel, cpu_count, delayed  # lazy import
+
+    from ptetools.tools import make_blocks
+
+    circuits = list(circuits)
+    if block_size is None:
+        number_of_workers = cpu_count() if n_jobs < 0 else n_jobs
+        block_size = max(len(circuits) // (4 * max(number_of_workers, 1)), 1)
+    blocks = make_blocks(len(circuits), block_size)
+
+    results = Parallel(n_jobs=n_jobs)(delayed(_run_passes_block)(circuits[start:end], passes) for start, end in blocks)
+    return list(itertools.chain.from_iterable(results))
+
+
+def _parameter_key(value: Any) -> Any:
+    if isinstance(value, ParameterExpression):
+        return ("parameter", str(value))
+    if isinstance(value, np.ndarray):
+        return ("array", value.shape, value.tobytes())
+    return value
+
+
+def _circuit_structure_key(circuit: QuantumCircuit) -> tuple:
+    """Return key describing the gate sequence, qubits, clbits and parameters of a circuit
+
+    Unbound parameters are described by their name, so circuits that differ only in the parameter objects have the
+    same key.
+    """
+    qubit_indices = {qubit: index for index, qubit in enumerate(circuit.qubits)}
+    clbit_indices = {clbit: index for index, clbit in enumerate(circuit.clbits)}
+    instructions = tuple(
+        (
+            instruction.name,
+            tuple([qubit_indices[q] for q in instruction.qubits]),
+            tuple([clbit_indices[c] for c in instruction.clbits]),
+            tuple([_parameter_key(p) for p in instruction.params]),
+            instruction.operation.unit if instruction.name == "delay" else None,
+        )
+        for instruction in circuit.data
+    )
+    return (circuit.num_qubits, circuit.num_clbits, _parameter_key(circuit.global_phase), instructions)
+
+
+class _CircuitTemplate:
+    """Circuit that is hashed and compared by the structure of the circuit"""
+
+    __slots__ = ("circuit", "key", "_hash")
+
+    def __init__(self, circuit: QuantumCircuit):
+        self.circuit = circuit
+        self.key = _circuit_structure_key(circuit)
+        self._hash = hash(self.key)
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _CircuitTemplate) and self.key == other.key
+
+
+class TemplatePassCache(_RebuiltCachesMixin):
+    def __init__(self, passes: Sequence[BasePass], maxsize: int | None = 128) -> None:
+        """Cache of the results of transpiler passes for circuits with the same structure
+
+        Circuits are keyed on a structural hash of the gate sequence, qubits and parameters, where unbound parameters
+        are identified by their name. The passes are applied to the circuit with unbound parameters. On a cache hit
+        the transformed template is returned with the parameters of the new circuit bound, instead of running
+        the passes again. Simplifications that depend on the values of the unbound parameters (e.g. removal of
+        rotations with zero angle) are therefore not performed. Circuits with control flow operations are not
+        cached, the passes are applied to these circuits directly.
+
+        Args:
+            passes: Transpiler passes to apply
+            maxsize: Maximum number of templates in the (least recently used) cache. If None, the cache is unbounded
+        """
+        self.passes = list(passes)
+        self.maxsize = maxsize
+        self._initialize_caches()
+
+    _cache_attributes = ("_transformed_template",)
+
+    def _initialize_caches(self) -> None:
+        self._transformed_template = lru_cache(maxsize=self.maxsize)(self._transform_template)
+
+    def _transform_template(self, template: _CircuitTemplate) -> QuantumCircuit:
+        return PassManager(self.passes).run(template.circuit)
+
+    def cache_info(self) -> Any:
+        """Return hits, misses, maximum size and current size of the cache"""
+        return self._transformed_template.cache_info()
+
+    def cache_clear(self) -> None:
+        """Clear the cache"""
+        self._transformed_template.cache_clear()
+
+    def run(
+        self, circuit: QuantumCircuit, parameter_values: Mapping[Parameter, Any] | Sequence[Any] | None = None
+    ) -> QuantumCircuit:
+        """Apply the passes to a circuit
+
+        Args:
+            circuit: Circuit, optionally with unbound parameters
+            parameter_values: Values for the unbound parameters, either as a mapping or as a sequence in the order
+                of `circuit.parameters`. If None, the parameters of the result are the parameters of the circuit
+        Returns:
+            Transformed circuit
+        """
+        if circuit.has_control_flow_op():
+            # the blocks and conditions of control flow operations are not part of the structural key
+            transformed = PassManager(self.passes).run(circuit)
+        else:
+            transformed = self._transformed_template(_CircuitTemplate(circuit))
+
+        parameters = circuit.parameters
+        if parameter_values is None:
+            values: Sequence[Any] = list(parameters)
+        elif isinstance(parameter_values, Mapping):
+            values = [parameter_values[parameter] for parameter in parameters]
+        else:
+            values = list(parameter_values)
+            if len(values) != len(parameters):
+                raise ValueError(f"number of parameter values {len(values)} does not match {len(parameters)}")
+
+        if parameters:
+            # the parameters are matched by name, since the template can be created from a different circuit
+            parameter_map = dict(zip((parameter.name for parameter in parameters), values))
+            result = transformed.assign_parameters({p: parameter_map[p.name] for p in transformed.parameters})
+        else:
+            result = transformed.copy()
+        result.name = circuit.name
+        return result
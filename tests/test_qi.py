@@ -2,7 +2,11 @@ import io
 import unittest
 from contextlib import redirect_stdout
 
-from ptetools.qi import qi_counts2qiskit, report_qi_status
+import numpy as np
+import pytest
+
+from ptetools.qi import hexstrings2indices, qi_counts2qiskit, qi_counts2qiskit_batch, report_qi_status
+from ptetools.qiskit import CountsArray, counts2dense_batch
 
 
 class TestQi(unittest.TestCase):
@@ -19,5 +23,29 @@ def test_qi_counts2qiskit():
     assert mmq == [{"00000": 8182, "00100": 10}, {"00000": 4137, "00100": 4055}, {"00000": 263, "00100": 7929}]
 
 
+def test_hexstrings2indices():
+    keys = ["0x0", "0x4", "1f", "0XAb", "0x" + "7" + 15 * "f"]
+    np.testing.assert_array_equal(hexstrings2indices(keys), [int(k, 16) for k in keys])
+    assert hexstrings2indices([]).size == 0
+    with pytest.raises(ValueError):
+        hexstrings2indices(["0xg"])
+    with pytest.raises(ValueError):
+        hexstrings2indices(["0x" + 16 * "f"])
+
+
+def test_qi_counts2qiskit_batch():
+    mm = [{"0x0": 8182, "0x4": 10}, {}, {"0x0": 263, "0x4": 7929}]
+    assert qi_counts2qiskit_batch(mm, 3) == [{"000": 8182, "100": 10}, {}, {"000": 263, "100": 7929}]
+
+    arrays = qi_counts2qiskit_batch(mm, 3, output="counts_array")
+    assert arrays[2] == CountsArray([0, 4], [263, 7929], number_of_bits=3)
+    np.testing.assert_array_equal(counts2dense_batch(arrays, 3)[:, 4], [10, 0, 7929])
+
+    with pytest.raises(ValueError):
+        qi_counts2qiskit_batch(mm, 2)
+    with pytest.raises(ValueError):
+        qi_counts2qiskit_batch(mm, 3, output="dense")  # ty: ignore[invalid-argument-type]
+
+
 if __name__ == "__main__":
     unittest.main()
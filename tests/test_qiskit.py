@@ -1,22 +1,43 @@
+import os
+import pickle
+import tempfile
 import unittest
 
 import numpy as np
 import qiskit.circuit.library
+import qiskit.circuit.random
 from qiskit import transpile
 from qiskit.circuit import Parameter, QuantumCircuit
-from qiskit.circuit.library import PhaseGate, U1Gate, U2Gate, U3Gate, UGate
+from qiskit.circuit.library import PhaseGate, RXGate, U1Gate, U2Gate, U3Gate, UGate
 from qiskit.converters import circuit_to_dag, dag_to_circuit
+from qiskit.result import marginal_distribution
+from qiskit.transpiler import PassManager
+from qiskit_experiments.library.randomized_benchmarking.clifford_utils import CliffordUtils
 
 from ptetools.qiskit import (
+    MAXIMUM_CACHED_NUMBER_OF_BITS,
+    BitstringLabels,
+    CountsArray,
     DecomposeU,
+    MergeRotations,
     ModifyDelayGate,
     RemoveGateByName,
+    RemoveSmallRotations,
     RemoveZeroDelayGate,
     ReplaceGate,
+    TemplatePassCache,
+    TensoredReadoutMitigator,
+    average_gate_fidelity,
+    bit_matrix,
     bitlist_to_int,
+    bitstring_array,
+    bitstrings2indices,
+    bootstrap_counts,
     choi_to_unitary,
     circuit2matrix,
+    circuits_to_matrices,
     counts2dense,
+    counts2dense_batch,
     counts2fractions,
     delay_gate,
     dense2sparse,
@@ -25,14 +46,26 @@ from ptetools.qiskit import (
     generate_bitstrings,
     generate_state_labels,
     index2bitstring,
+    indices2bitstrings,
     invert_permutation,
     largest_remainder_rounding,
+    largest_remainder_rounding_batch,
+    marginalize_counts,
+    marginalize_counts_batch,
     normalize_fractions,
     normalize_probability,
     permute_bits,
+    permute_bits_array,
     permute_counts,
+    permute_counts_batch,
     permute_string,
+    process_distance,
+    process_fidelity,
     random_clifford_circuit,
+    random_clifford_circuits,
+    randomized_benchmarking_sequences,
+    run_passes_parallel,
+    select_bits_array,
 )
 
 
@@ -48,6 +81,50 @@ class TestBitConversions(unittest.TestCase):
         assert generate_bitstrings(1) == ["0", "1"]
         assert generate_bitstrings(2) == ["00", "01", "10", "11"]
 
+    def test_bit_matrix(self):
+        np.testing.assert_array_equal(bit_matrix(2), [[0, 0], [0, 1], [1, 0], [1, 1]])
+        assert bit_matrix(0).shape == (1, 0)
+        bits = bit_matrix(9)
+        assert bits.shape == (2**9, 9)
+        assert not bits.flags.writeable
+        np.testing.assert_array_equal(bits[5], [int(b) for b in index2bitstring(5, 9)])
+
+    def test_bitstring_array(self):
+        labels = bitstring_array(3)
+        assert labels.dtype == np.dtype("U3")
+        assert labels.tolist() == generate_bitstrings(3)
+        assert bitstring_array(3) is labels
+        assert not labels.flags.writeable
+        assert bitstring_array(2, "S").tolist() == [b"00", b"01", b"10", b"11"]
+        with self.assertRaises(ValueError):
+            bitstring_array(2, "X")  # ty: ignore[invalid-argument-type]
+
+    def test_bitstring_cache_small_number_of_bits(self):
+        bitstring_array.cache_clear()
+        assert bitstring_array(MAXIMUM_CACHED_NUMBER_OF_BITS) is bitstring_array(MAXIMUM_CACHED_NUMBER_OF_BITS)
+        labels = bitstring_array(MAXIMUM_CACHED_NUMBER_OF_BITS + 1)
+        assert labels[-1] == "1" * (MAXIMUM_CACHED_NUMBER_OF_BITS + 1)
+        assert bitstring_array(MAXIMUM_CACHED_NUMBER_OF_BITS + 1) is not labels
+        assert bitstring_array.cache_info().currsize == 1
+        assert generate_bitstrings(MAXIMUM_CACHED_NUMBER_OF_BITS + 1) == labels.tolist()
+        np.testing.assert_array_equal(
+            bit_matrix(MAXIMUM_CACHED_NUMBER_OF_BITS + 1)[[0, 5, -1]],
+            [[int(b) for b in label] for label in labels[[0, 5, -1]]],
+        )
+
+    def test_BitstringLabels(self):
+        labels = BitstringLabels(2)
+        assert len(labels) == 4
+        assert list(labels) == generate_bitstrings(2)
+        assert labels[-1] == "11"
+        assert labels[1:3] == ["01", "10"]
+        with self.assertRaises(IndexError):
+            labels[4]
+
+        labels = BitstringLabels(50, template="|{}>")
+        assert labels[3] == "|" + 48 * "0" + "11>"
+        assert "number_of_bits=50" in repr(labels)
+
     def test_bitlist_to_int(self):
         assert bitlist_to_int([0, 1, 1]) == 3
 
@@ -79,6 +156,180 @@ class TestBitConversions(unittest.TestCase):
         permutation = [1, 0, 2, 3]
         assert permute_counts(counts, permutation) == {"1101": 945, "0001": 7, "1011": 16}
 
+    def test_permute_bits_array(self):
+        rng = np.random.default_rng(1)
+        for number_of_bits in [1, 4, 9, 17, 40]:
+            permutation = rng.permutation(number_of_bits).tolist()
+            indices = rng.integers(0, 2**number_of_bits, size=50, dtype=np.int64)
+            expected = [permute_bits(idx, permutation) for idx in indices.tolist()]
+            np.testing.assert_array_equal(permute_bits_array(indices, permutation), expected)
+
+        result = permute_bits_array(np.array([1, 2], dtype=np.uint64), [1, 0])
+        assert result.dtype == np.uint64
+        np.testing.assert_array_equal(result, [2, 1])
+
+        with self.assertRaises(ValueError):
+            permute_bits_array([1], [0, 0])
+        with self.assertRaises(TypeError):
+            permute_bits_array([1.0], [0])
+
+    def test_permute_counts_batch(self):
+        counts = [{"00": 10, "01": 20}, CountsArray.from_dict({"01": 1, "11": 2}), {}]
+        result = permute_counts_batch(counts, [1, 0])
+        assert result[0] == {"00": 10, "10": 20}
+        assert result[1].to_dict() == {"10": 1, "11": 2}
+        assert result[2] == {}
+
+    def test_select_bits_array(self):
+        np.testing.assert_array_equal(select_bits_array([0b1101, 0b0010], [0, 2]), [0b11, 0b00])
+        np.testing.assert_array_equal(select_bits_array([2**40], [40]), [1])
+        np.testing.assert_array_equal(select_bits_array([3, 1], []), [0, 0])
+        with self.assertRaises(ValueError):
+            select_bits_array([1], [0, 0])
+
+    def test_marginalize_counts(self):
+        counts = {"1110": 945, "0010": 7, "1011": 16, "0000": 0}
+        for qubits in [[0], [2], [1, 2], [3, 0], [0, 1, 2, 3]]:
+            assert marginalize_counts(counts, qubits) == marginal_distribution(counts, qubits)
+        marginal = marginalize_counts(CountsArray.from_dict(counts), [3, 0])
+        assert marginal == CountsArray.from_dict(marginal_distribution(counts, [3, 0]))
+        with self.assertRaises(ValueError):
+            marginalize_counts(counts, [4])
+
+    def test_marginalize_counts_batch(self):
+        counts = [{"110": 3, "011": 5}, {}, CountsArray.from_dict({"001": 0.25, "100": 0.75})]
+        subsets = [[0], [2, 1], []]
+        marginals = marginalize_counts_batch(counts, subsets)
+        assert [m.shape for m in marginals] == [(3, 2), (3, 4), (3, 1)]
+        np.testing.assert_array_equal(marginals[0], [[3, 5], [0, 0], [0.75, 0.25]])
+        np.testing.assert_array_equal(marginals[1], [[0, 0, 5, 3], [0, 0, 0, 0], [0.25, 0.75, 0, 0]])
+        np.testing.assert_array_equal(marginals[2], [[8], [0], [1]])
+
+        marginals = marginalize_counts_batch([{"1": 2}], [[0]])
+        assert marginals[0].dtype == np.int64
+
+
+class TestCountsArray(unittest.TestCase):
+    def test_bitstrings2indices(self):
+        np.testing.assert_array_equal(bitstrings2indices(["00", "11", "1 0"]), [0, 3, 2])
+        assert bitstrings2indices([]).size == 0
+        np.testing.assert_array_equal(bitstrings2indices(["0", "101", "1 0 1"]), [0, 5, 5])
+        np.testing.assert_array_equal(bitstrings2indices(["1" * 63]), [2**63 - 1])
+
+        rng = np.random.default_rng(1)
+        indices = rng.integers(0, 2**40, size=100)
+        np.testing.assert_array_equal(bitstrings2indices([f"{idx:040b}" for idx in indices]), indices)
+
+        with self.assertRaises(ValueError):
+            bitstrings2indices(["012"])
+        with self.assertRaises(ValueError):
+            bitstrings2indices(["1" * 64])
+        with self.assertRaises(ValueError):
+            bitstrings2indices(["1", "1" * 64])
+
+    def test_indices2bitstrings(self):
+        assert indices2bitstrings([0, 3, 2], 2) == ["00", "11", "10"]
+        assert indices2bitstrings(np.array([2**62 + 1]), 63) == ["1" + 60 * "0" + "01"]
+        assert indices2bitstrings([], 3) == []
+        assert indices2bitstrings([0], 0) == [index2bitstring(0, 0)]
+
+    def test_from_dict(self):
+        c = CountsArray.from_dict({"11": 3, "01": 5})
+        assert c.number_of_bits == 2
+        np.testing.assert_array_equal(c.indices, [1, 3])
+        np.testing.assert_array_equal(c.counts, [5, 3])
+        assert c.total() == 8
+        assert len(c) == 2
+
+        assert CountsArray.from_dict({"1": 3}, number_of_bits=3).to_dict() == {"001": 3}
+
+    def test_round_trip(self):
+        counts = {"1110": 945, "0010": 7, "1011": 16}
+        c = CountsArray.from_dict(counts)
+        assert c.to_dict() == counts
+        np.testing.assert_array_equal(c.to_dense(), counts2dense(counts, 4))
+        assert CountsArray.from_dense(c.to_dense()) == c
+
+    def test_duplicate_indices_are_merged(self):
+        c = CountsArray([3, 1, 3], [1, 2, 4], number_of_bits=2)
+        np.testing.assert_array_equal(c.indices, [1, 3])
+        np.testing.assert_array_equal(c.counts, [2, 5])
+        assert c.counts.dtype == np.int64
+
+    def test_invalid_input(self):
+        with self.assertRaises(ValueError):
+            CountsArray([0, 1], [1], number_of_bits=1)
+        with self.assertRaises(ValueError):
+            CountsArray([4], [1], number_of_bits=2)
+        with self.assertRaises(ValueError):
+            CountsArray([], [], number_of_bits=64)
+
+    def test_counts_functions(self):
+        counts = {"1110": 945, "0010": 7, "1011": 16}
+        c = CountsArray.from_dict(counts)
+
+        assert permute_counts(c, [1, 0, 2, 3]).to_dict() == permute_counts(counts, [1, 0, 2, 3])
+        assert counts2fractions(c).to_dict() == counts2fractions(counts)
+        np.testing.assert_array_equal(counts2dense(c, 5), counts2dense(counts, 5))
+        assert dense2sparse(counts2dense(counts, 4), counts_array=True) == c
+
+        f = counts2fractions(c)
+        assert fractions2counts(f, 1024).to_dict() == fractions2counts(counts2fractions(counts), 1024)
+        np.testing.assert_allclose(fractions2counts(f, 10, integer_rounding=False).total(), 10)
+
+
+class TestTensoredReadoutMitigator(unittest.TestCase):
+    def setUp(self):
+        self.a0 = np.array([[0.95, 0.1], [0.05, 0.9]])
+        self.a1 = np.array([[0.9, 0.2], [0.1, 0.8]])
+        self.a2 = np.array([[0.99, 0.05], [0.01, 0.95]])
+        self.full = np.kron(self.a2, np.kron(self.a1, self.a0))
+
+    def test_mitigate_dense(self):
+        mitigator = TensoredReadoutMitigator([self.a0, self.a1, self.a2])
+        p = np.random.default_rng(1).random((4, 8))
+        expected = np.linalg.solve(self.full, p.T).T
+        np.testing.assert_allclose(mitigator.mitigate_dense(p), expected)
+        np.testing.assert_allclose(mitigator.mitigate_dense(self.full[:, 3]), np.eye(8)[3], atol=1e-12)
+
+    def test_qubit_groups(self):
+        a21 = np.kron(self.a1, self.a2)  # bit 0 of the group matrix is qubit 2
+        mitigator = TensoredReadoutMitigator([a21, self.a0], qubits=[[2, 1], [0]])
+        p = np.random.default_rng(2).random(8)
+        np.testing.assert_allclose(mitigator.mitigate_dense(p), np.linalg.solve(self.full, p))
+
+        mitigator = TensoredReadoutMitigator([self.a0], qubits=[[1]], number_of_bits=2)
+        np.testing.assert_allclose(mitigator.mitigate_dense(p[:4]), np.kron(np.linalg.inv(self.a0), np.eye(2)) @ p[:4])
+
+        with self.assertRaises(ValueError):
+            TensoredReadoutMitigator([self.a0, self.a1], qubits=[[0], [0]])
+        with self.assertRaises(ValueError):
+            TensoredReadoutMitigator([np.eye(3)])
+        with self.assertRaises(ValueError):
+            TensoredReadoutMitigator([self.a0], qubits=[[0, 1]])
+
+    def test_mitigate_counts(self):
+        mitigator = TensoredReadoutMitigator([self.a0, self.a1, self.a2])
+        counts = [{"000": 900, "001": 60, "110": 40}, CountsArray.from_dict({"111": 10}, 3)]
+        dense = mitigator.mitigate_counts(counts)
+        assert dense.shape == (2, 8)
+        np.testing.assert_allclose(dense[0], np.linalg.solve(self.full, counts2dense(counts[0], 3) / 1000))
+
+        sparse = mitigator.mitigate_counts_sparse(counts, block_size=2)
+        for row, quasi_probabilities in enumerate(sparse):
+            np.testing.assert_allclose(quasi_probabilities.counts, dense[row, quasi_probabilities.indices])
+        np.testing.assert_array_equal(sparse[0].indices, [0, 1, 6])
+
+    def test_mitigate_counts_sparse_partially_covered(self):
+        counts = [{"00": 50, "11": 50}, {"000": 30, "101": 20, "110": 40, "011": 10}]
+        for mitigator, histogram in [
+            (TensoredReadoutMitigator([self.a0], qubits=[[0]], number_of_bits=2), counts[0]),
+            (TensoredReadoutMitigator([self.a0, self.a2], qubits=[[0], [2]], number_of_bits=3), counts[1]),
+        ]:
+            dense = mitigator.mitigate_counts([histogram])[0]
+            sparse = mitigator.mitigate_counts_sparse([histogram], block_size=3)[0]
+            np.testing.assert_allclose(sparse.counts, dense[sparse.indices])
+
 
 class TestQiskit(unittest.TestCase):
     def test_ModifyDelayGate(self):
@@ -89,6 +340,32 @@ class TestQiskit(unittest.TestCase):
         qc = p(qc)
         assert list(qc)[0].operation.duration == 6
 
+    def test_ModifyDelayGate_merge_delays(self):
+        time_unit = 20e-9
+        qc = QuantumCircuit(2)
+        qc.delay(2.4 * time_unit, 0, unit="s")
+        qc.delay(3, 0)
+        qc.delay(2.4 * time_unit, 0, unit="s")
+        qc.delay(5, 1)
+        qc.x(0)
+        qc.delay(1e3, 0, unit="ns")
+        qc.delay(4 * time_unit, 0, unit="s")
+        qc.cx(0, 1)
+        qc.delay(1.2 * time_unit, 1, unit="s")
+
+        result = ModifyDelayGate(dt=time_unit, merge_delays=True)(qc)
+        delays = [
+            (result.find_bit(i.qubits[0]).index, i.operation.duration, i.operation.unit)
+            for i in result
+            if i.name == "delay"
+        ]
+        self.assertEqual(result.count_ops(), {"delay": 5, "x": 1, "cx": 1})
+        self.assertIn((0, 8, "dt"), delays)
+        self.assertIn((1, 5, "dt"), delays)
+        self.assertIn((0, 1e3, "ns"), delays)
+        self.assertIn((0, 4, "dt"), delays)
+        self.assertIn((1, 1, "dt"), delays)
+
     def test_dense2sparse(self):
         assert dense2sparse(np.array([1, 0])) == {"0": 1}
         assert dense2sparse(np.array([1, 2])) == {"0": 1, "1": 2}
@@ -98,6 +375,86 @@ class TestQiskit(unittest.TestCase):
         np.testing.assert_array_equal(counts2dense({"1": 100}, number_of_bits=1), np.array([0, 100]))
         np.testing.assert_array_equal(counts2dense({"1": 100}, number_of_bits=2), np.array([0, 100, 0, 0]))
 
+    def test_dense2sparse_large(self):
+        d = np.zeros(2**20, dtype=int)
+        d[[3, 2**19]] = [5, 7]
+        assert dense2sparse(d) == {"00000000000000000011": 5, "10000000000000000000": 7}
+
+    def test_counts2dense_memmap(self):
+        with self.assertRaises(ValueError):
+            counts2dense({"1": 100}, number_of_bits=40)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "dense.npy")
+            d = counts2dense({"1 1": 100, "00": 2}, number_of_bits=2, filename=filename)
+            assert isinstance(d, np.memmap)
+            np.testing.assert_array_equal(d, [2, 0, 0, 100])
+            del d
+            np.testing.assert_array_equal(np.load(filename), [2, 0, 0, 100])
+
+    def test_counts2dense_batch(self):
+        counts = [{"01": 2, "10": 3}, {}, CountsArray.from_dict({"11": 4})]
+        d = counts2dense_batch(counts, number_of_bits=2)
+        np.testing.assert_array_equal(d, [[0, 2, 3, 0], [0, 0, 0, 0], [0, 0, 0, 4]])
+        assert d.dtype == np.int64
+
+        d = counts2dense_batch([{"0": 0.5, "1": 0.5}], number_of_bits=1)
+        np.testing.assert_array_equal(d, [[0.5, 0.5]])
+        assert counts2dense_batch([], number_of_bits=1).shape == (0, 2)
+
+        s = counts2dense_batch(counts, number_of_bits=40, sparse=True)
+        assert s.shape == (3, 2**40)
+        np.testing.assert_array_equal(s.indptr, [0, 2, 2, 3])
+        np.testing.assert_array_equal(s.indices, [1, 2, 3])
+        np.testing.assert_array_equal(s.data, [2, 3, 4])
+        with self.assertRaises(ValueError):
+            counts2dense_batch(counts, number_of_bits=40)
+
+    def test_bootstrap_counts(self):
+        counts = [{"00": 80, "01": 20}, CountsArray.from_dict({"11": 5, "00": 5}), {}]
+        outcomes, resampled = bootstrap_counts(counts, 200, seed=1)
+        np.testing.assert_array_equal(outcomes, [0, 1, 3])
+        assert resampled.shape == (3, 200, 3)
+        np.testing.assert_array_equal(resampled.sum(axis=-1), np.array([[100], [10], [0]]) * np.ones((1, 200)))
+        np.testing.assert_array_equal(resampled[0, :, 2], 0)
+        np.testing.assert_allclose(resampled[0].mean(axis=0), [80, 20, 0], atol=3)
+
+        _, resampled2 = bootstrap_counts(counts, 200, seed=1)
+        np.testing.assert_array_equal(resampled, resampled2)
+
+        def fraction_zero(outcomes, resampled_counts):
+            return resampled_counts[..., outcomes == 0].sum(axis=-1) / resampled_counts.sum(axis=-1)
+
+        values = bootstrap_counts(counts[:1], 500, statistic=fraction_zero, seed=2)
+        assert values.shape == (1, 500)
+        self.assertAlmostEqual(values.std(), np.sqrt(0.8 * 0.2 / 100), delta=0.01)
+
+        assert bootstrap_counts([{}], 10)[1].shape == (1, 10, 0)
+        with self.assertRaises(ValueError):
+            bootstrap_counts([{"0": 0.5, "1": 0.5}], 10)
+
+    def test_bootstrap_counts_block_size(self):
+        counts = [{"000": 80, "001": 20}, {"110": 50, "111": 50}, {"000": 30, "010": 70}]
+        block_outcomes = []
+
+        def fraction_zero(outcomes, resampled_counts):
+            block_outcomes.append(outcomes.tolist())
+            return resampled_counts[..., outcomes == 0].sum(axis=-1) / resampled_counts.sum(axis=-1)
+
+        values = bootstrap_counts(counts, 400, statistic=fraction_zero, seed=1, block_size=1)
+        assert values.shape == (3, 400)
+        assert block_outcomes == [[0, 1], [6, 7], [0, 2]]
+        np.testing.assert_allclose(values.mean(axis=1), [0.8, 0, 0.3], atol=0.02)
+
+        values = bootstrap_counts(counts, 10, statistic=fraction_zero, seed=1, block_size=2)
+        assert values.shape == (3, 10)
+        values = bootstrap_counts([], 10, statistic=fraction_zero, seed=1, block_size=2)
+        assert values.shape == (0, 10)
+        with self.assertRaises(ValueError):
+            bootstrap_counts(counts, 10, block_size=2)
+        with self.assertRaises(ValueError):
+            bootstrap_counts(counts, 10, statistic=fraction_zero, block_size=0)
+
     def test_counts2fractions(self):
         assert counts2fractions({"1": 0}) == {"1": 0.0}
         assert counts2fractions({"1": 100, "0": 50}) == {"0": 0.3333333333333333, "1": 0.6666666666666666}
@@ -109,6 +466,55 @@ class TestQiskit(unittest.TestCase):
         c, index = random_clifford_circuit(2)
         assert c.num_qubits == 2
 
+    def test_random_clifford_circuits(self):
+        circuits, indices = random_clifford_circuits(1, 10, seed=1)
+        self.assertEqual(len(circuits), 10)
+        np.testing.assert_array_equal(indices, np.random.default_rng(1).integers(24, size=10))
+        for circuit, index in zip(circuits, indices):
+            self.assertEqual(circuit.num_qubits, 1)
+            self.assertEqual(
+                qiskit.quantum_info.Clifford(circuit),
+                qiskit.quantum_info.Clifford(CliffordUtils.clifford_1_qubit_circuit(index)),
+            )
+
+        circuits, indices = random_clifford_circuits(2, 1000, seed=2)
+        self.assertEqual(circuits[0].num_qubits, 2)
+        self.assertTrue(np.all((indices >= 0) & (indices < 11520)))
+        for circuit, index in zip(circuits, indices):
+            if index == indices[0]:
+                self.assertIs(circuit, circuits[0])
+
+        _, indices_again = random_clifford_circuits(2, 1000, seed=2)
+        np.testing.assert_array_equal(indices, indices_again)
+        self.assertEqual(random_clifford_circuits(2, 0)[1].shape, (0,))
+        with self.assertRaises(NotImplementedError):
+            random_clifford_circuits(3, 1)
+
+    def test_randomized_benchmarking_sequences(self):
+        identity = qiskit.quantum_info.Clifford(QuantumCircuit(2))
+        lengths = [0, 1, 4, 12]
+        sequences = randomized_benchmarking_sequences(2, lengths, seeds=[1, 2], output="indices")
+        circuits = randomized_benchmarking_sequences(2, lengths, seeds=[1, 2])
+        self.assertEqual(len(sequences), 2)
+        for seed_sequences, seed_circuits in zip(sequences, circuits):
+            self.assertEqual([len(sequence) for sequence in seed_sequences], [length + 1 for length in lengths])
+            np.testing.assert_array_equal(seed_sequences[2][:4], seed_sequences[3][:4])
+            for sequence, circuit in zip(seed_sequences, seed_circuits):
+                self.assertEqual(circuit.count_ops()["barrier"], len(sequence))
+                self.assertEqual(qiskit.quantum_info.Clifford(circuit), identity)
+                composed = QuantumCircuit(2)
+                for index in sequence:
+                    composed.compose(CliffordUtils.clifford_2_qubit_circuit(index), inplace=True)
+                self.assertEqual(qiskit.quantum_info.Clifford(composed), identity)
+
+        for sequence in randomized_benchmarking_sequences(1, [3, 50], seeds=[np.random.default_rng(3)])[0]:
+            self.assertEqual(qiskit.quantum_info.Clifford(sequence), qiskit.quantum_info.Clifford(QuantumCircuit(1)))
+
+        with self.assertRaises(ValueError):
+            randomized_benchmarking_sequences(1, [-1], seeds=[1])
+        with self.assertRaises(ValueError):
+            randomized_benchmarking_sequences(1, [1], seeds=[1], output="matrices")
+
     def test_normalize_fractions(self):
         np.testing.assert_array_equal(normalize_fractions(np.array([0, 1.001])), [0, 1])
         np.testing.assert_allclose(
@@ -221,6 +627,79 @@ class TestQiskit(unittest.TestCase):
         self.assertEqual(instructions.count("rx"), 1)  # Original RX preserved
         self.assertNotIn("barrier", instructions)  # No replacement occurred
 
+    def test_ReplaceGate_rules(self):
+        """Test ReplaceGate with a mapping of gate types to replacement circuits"""
+        cx_replacement = QuantumCircuit(2, global_phase=0.5)
+        cx_replacement.h(1)
+        cx_replacement.cz(0, 1)
+        cx_replacement.h(1)
+        x_replacement = QuantumCircuit(1)
+        x_replacement.sx(0)
+        x_replacement.sx(0)
+        rx_replacement = QuantumCircuit(1)
+        rx_replacement.barrier()
+
+        rules = {
+            qiskit.circuit.library.CXGate: cx_replacement,
+            qiskit.circuit.library.XGate: (x_replacement, [0, 2]),
+            qiskit.circuit.library.RXGate: (rx_replacement, 1),
+        }
+        qpass = ReplaceGate(rules)
+
+        qc = QuantumCircuit(3)
+        qc.cx(0, 1)
+        qc.x(0)
+        qc.x(1)
+        qc.rx(0.1, 0)
+        qc.rx(0.2, 1)
+        qc.cx(2, 1)
+        qc.x(2)
+
+        result = qpass(qc)
+        self.assertEqual(result.count_ops(), {"h": 4, "cz": 2, "sx": 4, "x": 1, "rx": 1, "barrier": 1})
+        self.assertEqual(result.global_phase, 1.0)
+
+        sequential = PassManager(
+            [
+                ReplaceGate(gate, *value) if isinstance(value, tuple) else ReplaceGate(gate, value)
+                for gate, value in rules.items()
+            ]
+        ).run(qc)
+        self.assertEqual(result, sequential)
+
+    def test_ReplaceGate_first_matching_rule(self):
+        replacement_circuit = QuantumCircuit(1)
+        replacement_circuit.barrier()
+        rules = {
+            RXGate: (replacement_circuit, 1),
+            qiskit.circuit.Gate: QuantumCircuit(1),
+        }
+        qc = QuantumCircuit(2)
+        qc.rx(0.1, 0)
+        qc.rx(0.2, 1)
+        self.assertEqual(circuit_instruction_names(ReplaceGate(rules)(qc)), ["barrier"])
+
+    def test_ReplaceGate_attributes(self):
+        replacement_circuit = QuantumCircuit(1)
+        qpass = ReplaceGate(RXGate, replacement_circuit, qubits=[0, 2])
+        self.assertIs(qpass.gate, RXGate)
+        self.assertIs(qpass.replacement_circuit, replacement_circuit)
+        self.assertIs(qpass.replacement_dag, qpass.rules[0].replacement_dag)
+        self.assertEqual(qpass.qubit_set, {0, 2})
+        self.assertIsInstance(qpass.qubit_set, set)
+        self.assertIsNone(ReplaceGate(RXGate, replacement_circuit).qubit_set)
+
+        qpass = ReplaceGate({RXGate: replacement_circuit})
+        self.assertEqual(len(qpass.rules), 1)
+        for attribute in ["gate", "replacement_circuit", "replacement_dag", "qubit_set"]:
+            self.assertIsNone(getattr(qpass, attribute))
+
+    def test_ReplaceGate_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            ReplaceGate(RXGate)
+        with self.assertRaises(ValueError):
+            ReplaceGate({RXGate: QuantumCircuit(1)}, QuantumCircuit(1))
+
     def test_RemoveGateByName(self):
         qc = QuantumCircuit(3)
         qc.h(0)
@@ -233,6 +712,29 @@ class TestQiskit(unittest.TestCase):
             qc_transpiled = RemoveGateByName(name)(qc)
             self.assertNotIn(name, circuit_instruction_names(qc_transpiled))
 
+    def test_RemoveGateByName_multiple_names(self):
+        qc = QuantumCircuit(2)
+        qc.h(0)
+        qc.barrier()
+        qc.x(1)
+        qc.barrier()
+        qc.x(0)
+
+        property_set = {}
+        qc_transpiled = RemoveGateByName({"x", "barrier", "dummy"})(qc, property_set=property_set)
+        self.assertEqual(circuit_instruction_names(qc_transpiled), ["h"])
+        self.assertEqual(property_set["removed_gate_counts"], {"x": 2, "barrier": 2, "dummy": 0})
+
+        pass_manager = PassManager([RemoveGateByName("barrier"), RemoveGateByName(["h", "x"])])
+        pass_manager.run(qc)
+        self.assertEqual(pass_manager.property_set["removed_gate_counts"], {"barrier": 2, "h": 1, "x": 2})
+
+        qc = random_cleanup_circuit(3, 80, seed=1)
+        pass_manager = PassManager(cleanup_passes())
+        result = pass_manager.run(qc)
+        self.assertNotIn("barrier", result.count_ops())
+        self.assertEqual(pass_manager.property_set["removed_gate_counts"], {"barrier": qc.count_ops()["barrier"]})
+
     def test_RemoveZeroDelayGate(self):
         qc = QuantumCircuit(3)
         qc.delay(0)
@@ -246,6 +748,73 @@ class TestQiskit(unittest.TestCase):
             circuit_instruction_names(qc_transpiled), ["barrier", "delay", "barrier", "delay", "delay", "delay"]
         )
 
+    def test_RemoveSmallRotations(self):
+        theta = Parameter("theta")
+        qc = QuantumCircuit(2)
+        qc.rz(0, 0)
+        qc.rx(1e-4, 1)
+        qc.ry(2 * np.pi, 0)
+        qc.p(theta, 0)
+        qc.rz(theta, 1)
+        qc.crz(0.0, 0, 1)
+        qc.crx(0.5, 0, 1)
+        qc.rz(np.float32(0), 1)
+
+        self.assertEqual(sorted(circuit_instruction_names(RemoveSmallRotations()(qc))), ["crx", "p", "rx", "ry", "rz"])
+        self.assertEqual(
+            sorted(circuit_instruction_names(RemoveSmallRotations(epsilon=1e-3)(qc))), ["crx", "p", "ry", "rz"]
+        )
+        self.assertEqual(
+            sorted(circuit_instruction_names(RemoveSmallRotations(epsilon=1e-3, modulo2pi=True)(qc))),
+            ["crx", "p", "rz"],
+        )
+
+        qc_bound = qc.assign_parameters({theta: 0})
+        self.assertEqual(sorted(circuit_instruction_names(RemoveSmallRotations()(qc_bound))), ["crx", "rx", "ry"])
+
+    def test_MergeRotations(self):
+        qc = QuantumCircuit(2)
+        qc.rz(0.1, 0)
+        qc.rz(0.2, 0)
+        qc.cx(0, 1)
+        qc.rz(0.3, 0)
+        qc.rz(0.5, 1)
+        qc.cx(0, 1)
+        qc.rz(0.5, 1)
+        qc.rx(np.pi / 2, 0)
+        qc.rx(np.pi / 2, 0)
+        qc.p(np.pi, 1)
+        qc.p(-np.pi, 1)
+
+        result = MergeRotations()(qc)
+        self.assertEqual(result.count_ops(), {"rz": 3, "cx": 2, "rx": 1})
+        angles = sorted(float(i.operation.params[0]) for i in result if i.operation.name in ["rz", "rx"])
+        np.testing.assert_allclose(angles, [0.5, 0.5, 0.6, np.pi])
+        self.assertTrue(qiskit.quantum_info.Operator(result).equiv(qiskit.quantum_info.Operator(qc)))
+
+        qc = QuantumCircuit(1)
+        qc.rz(np.pi, 0)
+        qc.rz(np.pi + 1e-4, 0)
+        qc.barrier()
+        qc.rz(0.2, 0)
+        self.assertEqual(MergeRotations(epsilon=1e-3)(qc).count_ops(), {"rz": 2, "barrier": 1})
+        self.assertEqual(MergeRotations(epsilon=1e-3, modulo2pi=True)(qc).count_ops(), {"rz": 1, "barrier": 1})
+
+    def test_MergeRotations_decomposed_circuit(self):
+        qc = random_cleanup_circuit(3, 200, seed=2)
+        qc.remove_final_measurements()
+        qc = PassManager([RemoveGateByName(["measure", "delay"]), DecomposeU()]).run(qc)
+        result = MergeRotations()(qc)
+        self.assertLess(result.size(), qc.size())
+        self.assertTrue(qiskit.quantum_info.Operator(result).equiv(qiskit.quantum_info.Operator(qc)))
+
+        theta = Parameter("theta")
+        qc = QuantumCircuit(1)
+        qc.rz(theta, 0)
+        qc.rz(0.1, 0)
+        qc.rz(0.2, 0)
+        self.assertEqual(len(MergeRotations()(qc)), 2)
+
     def test_fractions2counts(self):
         number_set = np.array([20.2, 20.2, 20.2, 20.2, 19.2]) / 100
         r = largest_remainder_rounding(number_set, 100)
@@ -255,6 +824,45 @@ class TestQiskit(unittest.TestCase):
         assert fractions2counts(fractions, 100) == {0: 10, 1: 80, 2: 10}
         assert fractions2counts(fractions, 1024) == {0: 103, 1: 823, 2: 98}
 
+    def test_largest_remainder_rounding_batch(self):
+        def reference(fractions, total):
+            unround_numbers = (fractions / fractions.sum()) * total
+            order = np.argsort(-(unround_numbers % 1), kind="stable")
+            counts = unround_numbers.astype(int)
+            counts[order[: total - counts.sum()]] += 1
+            return counts
+
+        rng = np.random.default_rng(1)
+        fractions = rng.random((20, 7))
+        fractions[:, 3] = fractions[:, 4]
+        counts = largest_remainder_rounding_batch(fractions, 100)
+        for row in range(fractions.shape[0]):
+            np.testing.assert_array_equal(counts[row], reference(fractions[row], 100))
+            assert largest_remainder_rounding(fractions[row], 100) == counts[row].tolist()
+
+        counts = largest_remainder_rounding_batch([[0.5, 0.5], [0.2, 0.8]], [3, 10])
+        np.testing.assert_array_equal(counts, [[2, 1], [2, 8]])
+        assert largest_remainder_rounding_batch(np.zeros((0, 3)), 10).shape == (0, 3)
+
+    def test_fractions2counts_list(self):
+        fractions = [{"0": 0.101, "1": 0.804, "2": 0.096}, {"0": 1 / 3, "1": 2 / 3}, {}]
+        counts = fractions2counts(fractions, 100)
+        assert counts == [{"0": 10, "1": 80, "2": 10}, {"0": 33, "1": 67}, {}]
+        assert fractions2counts([], 100) == []
+
+    def test_fractions2counts_list_CountsArray(self):
+        counts = [CountsArray.from_dict({"00": 30, "11": 70}, 2), {"0": 40, "1": 60}]
+        fractions = counts2fractions(counts)
+        result = fractions2counts(fractions, 100)
+        assert isinstance(result[0], CountsArray)
+        np.testing.assert_array_equal(result[0].indices, counts[0].indices)
+        np.testing.assert_array_equal(result[0].counts, counts[0].counts)
+        assert result[1] == counts[1]
+
+        result = fractions2counts(fractions, 200, integer_rounding=False)
+        np.testing.assert_allclose(result[0].counts, [60, 140])
+        assert result[1] == {"0": 80.0, "1": 120.0}
+
     def test_circuit2matrix(self):
         for k in range(1, 4):
             x = circuit2matrix(QuantumCircuit(k))
@@ -266,6 +874,36 @@ class TestQiskit(unittest.TestCase):
         expected = np.array([[0.0 + 0.0j, 1.0 + 0.0j], [1.0 + 0.0j, 0.0 + 0.0j]])
         np.testing.assert_array_equal(x, expected)
 
+    def test_circuits_to_matrices(self):
+        rng = np.random.default_rng(1)
+        circuits = []
+        for _ in range(6):
+            qc = QuantumCircuit(3, global_phase=rng.normal())
+            qc.u(*rng.normal(size=3), 0)
+            qc.rx(rng.normal(), 1)
+            qc.ry(rng.normal(), 2)
+            qc.cx(0, 2)
+            qc.barrier()
+            qc.delay(20, 1)
+            qc.rz(rng.normal(), 0)
+            qc.p(rng.normal(), 1)
+            qc.append(U1Gate(rng.normal()), [2])
+            qc.append(U3Gate(*rng.normal(size=3)), [0])
+            qc.crz(rng.normal(), 2, 1)
+            qc.sx(1)
+            circuits.append(qc)
+        circuits.append(qiskit.circuit.random.random_circuit(3, depth=8, seed=2))
+
+        matrices = circuits_to_matrices(circuits, decimals=None)
+        self.assertEqual(matrices.shape, (len(circuits), 8, 8))
+        for qc, matrix in zip(circuits, matrices):
+            np.testing.assert_allclose(matrix, qiskit.quantum_info.Operator(qc).data, atol=1e-12)
+
+        np.testing.assert_array_equal(circuits_to_matrices(circuits[:2])[1], circuit2matrix(circuits[1]))
+        self.assertEqual(circuits_to_matrices([]).shape, (0, 1, 1))
+        with self.assertRaises(ValueError):
+            circuits_to_matrices([QuantumCircuit(1), QuantumCircuit(2)])
+
     def test_normalize_probability(self):
         np.testing.assert_array_equal(normalize_probability(np.array([0, 0.99], dtype=np.float64)), [0, 1])
         np.testing.assert_array_equal(normalize_probability(np.array([-0.01, 1.0099], dtype=np.float64)), [0, 1])
@@ -288,6 +926,8 @@ class TestQiskit(unittest.TestCase):
 
         labels_1qubit = generate_state_labels(1)
         assert len(labels_1qubit) == 2
+        labels_1qubit.append("dummy")
+        assert len(generate_state_labels(1)) == 2
 
     def test_delay_gate(self):
         gate = delay_gate(100e-9, 20e-9, round_dt=True)
@@ -296,6 +936,10 @@ class TestQiskit(unittest.TestCase):
         gate_no_round = delay_gate(duration=100e-9, dt=20e-9, round_dt=False)
         np.testing.assert_allclose(gate_no_round.params[0], 100e-9 / 20e-9, atol=1e-12)
 
+        info = delay_gate.cache_info()
+        self.assertEqual(info.maxsize, 1024)
+        self.assertLessEqual(info.currsize, info.maxsize)
+
     def test_fractions2counts_no_rounding(self):
         fractions = {0: 0.1, 1: 0.8, 2: 0.1}
         counts = fractions2counts(fractions, 100, integer_rounding=False)  # ty: ignore[invalid-argument-type]
@@ -318,6 +962,99 @@ class TestQiskit(unittest.TestCase):
         IC = np.exp(-np.angle(IC[0, 0]) * 1j) * IC
         np.testing.assert_almost_equal(IC, np.eye(IC.shape[0]))
 
+    def test_choi_to_unitary_batch(self):
+        import qutip
+
+        def reference_choi_to_unitary(choi):
+            dims = [[[2, 2], [2, 2]]] * 2
+            choi_qobj = qutip.Qobj((choi + choi.conj().T) / 2, dims=dims, superrep="choi")
+            kraus = qutip.core.superop_reps.to_kraus(choi_qobj)
+            U = kraus[np.argmax([np.abs(np.linalg.det(k.full())) for k in kraus])].full()
+            return np.exp(-np.angle(U[0, 0]) * 1j) * U
+
+        unitaries = [qiskit.quantum_info.random_unitary(4, seed=seed) for seed in range(5)]
+        chois = np.array(
+            [
+                0.9 * qiskit.quantum_info.Choi(unitary).data
+                + 0.1 * qiskit.quantum_info.Choi(qiskit.quantum_info.random_quantum_channel(4, seed=seed)).data
+                for seed, unitary in enumerate(unitaries)
+            ]
+        )
+        result = choi_to_unitary(chois)
+        self.assertEqual(result.shape, (5, 4, 4))
+        for choi, unitary, expected in zip(chois, result, unitaries):
+            np.testing.assert_allclose(unitary, reference_choi_to_unitary(choi), atol=1e-12)
+            np.testing.assert_array_equal(unitary, choi_to_unitary(choi))
+            overlap = np.trace(unitary.conj().T @ expected.data) / 4
+            self.assertGreater(np.abs(overlap), 0.9)
+
+    def test_fidelity_metrics(self):
+        unitaries = np.array([qiskit.quantum_info.random_unitary(4, seed=seed).data for seed in range(4)])
+        targets = np.array([qiskit.quantum_info.random_unitary(4, seed=10 + seed).data for seed in range(3)])
+        chois = np.array(
+            [
+                qiskit.quantum_info.Choi(qiskit.quantum_info.random_quantum_channel(4, seed=seed)).data
+                for seed in range(4)
+            ]
+        )
+
+        expected = np.array(
+            [
+                [
+                    qiskit.quantum_info.process_fidelity(
+                        qiskit.quantum_info.Operator(u), qiskit.quantum_info.Operator(v)
+                    )
+                    for v in targets
+                ]
+                for u in unitaries
+            ]
+        )
+        np.testing.assert_allclose(process_fidelity(unitaries, targets, pairwise=True), expected, atol=1e-12)
+        np.testing.assert_allclose(process_fidelity(unitaries[:3], targets), np.diag(expected), atol=1e-12)
+        np.testing.assert_allclose(process_fidelity(unitaries, np.exp(0.4j) * unitaries), 1)
+        np.testing.assert_allclose(
+            process_fidelity(unitaries, unitaries[0]), process_fidelity(unitaries, unitaries[:1], pairwise=True)[:, 0]
+        )
+
+        expected = np.array(
+            [
+                [
+                    qiskit.quantum_info.average_gate_fidelity(
+                        qiskit.quantum_info.Choi(c), qiskit.quantum_info.Operator(v)
+                    )
+                    for v in targets
+                ]
+                for c in chois
+            ]
+        )
+        np.testing.assert_allclose(
+            average_gate_fidelity(chois, targets, representation="choi", pairwise=True), expected, atol=1e-12
+        )
+        unitary_chois = np.array(
+            [qiskit.quantum_info.Choi(qiskit.quantum_info.Operator(u)).data for u in unitaries[:3]]
+        )
+        np.testing.assert_allclose(
+            process_fidelity(unitary_chois, targets, representation="choi"),
+            process_fidelity(unitaries[:3], targets),
+            atol=1e-12,
+        )
+
+        u, v = unitaries[0], targets[0]
+        phases = np.exp(1j * np.linspace(0, 2 * np.pi, 10001))
+        frobenius = np.min(np.linalg.norm(u[None] - phases[:, None, None] * v[None], axis=(1, 2))) / 2
+        self.assertAlmostEqual(process_distance(u, v), frobenius, places=6)
+        fidelity = process_fidelity(u, v)
+        self.assertAlmostEqual(process_distance(u, v, metric="trace"), np.sqrt(1 - fidelity))
+
+        with self.assertRaises(ValueError):
+            process_fidelity(unitaries, targets[:, :2, :2])
+        with self.assertRaises(ValueError):
+            process_fidelity(unitaries, targets, representation="choi")
+        with self.assertRaises(ValueError):
+            process_fidelity(unitaries, unitaries, representation="ptm")
+        with self.assertRaises(ValueError):
+            process_distance(u, v, metric="diamond")
+
     def test_counts2fractions_list(self):
         counts_list = [{"0": 50, "1": 50}, {"0": 25, "1": 75}]
         fractions_list = counts2fractions(counts_list)
@@ -330,6 +1067,159 @@ class TestQiskit(unittest.TestCase):
         assert fractions == {"0": 0.0, "1": 0.0}
 
 
+def random_cleanup_circuit(number_of_qubits: int, number_of_gates: int, seed: int) -> QuantumCircuit:
+    """Random circuit with gates that are modified by the ptetools passes"""
+    rng = np.random.default_rng(seed)
+    qc = QuantumCircuit(number_of_qubits, 1)
+    for _ in range(number_of_gates):
+        q = int(rng.integers(number_of_qubits))
+        q2 = (q + 1) % number_of_qubits
+        angle = float(rng.choice([0.0, 1e-4, np.pi / 2, 2 * np.pi, rng.normal()]))
+        match int(rng.integers(10)):
+            case 0:
+                qc.rz(angle, q)
+            case 1:
+                qc.rx(angle, q)
+            case 2:
+                qc.crz(angle, q, q2)
+            case 3:
+                qc.u(rng.normal(), angle, rng.normal(), q)
+            case 4:
+                qc.delay(float(rng.choice([0, 1e-7])), q, unit="s")
+            case 5:
+                qc.delay(int(rng.choice([0, 10])), q)
+            case 6:
+                qc.barrier()
+            case 7:
+                qc.cx(q, q2)
+            case 8:
+                qc.measure(q, 0)
+            case 9:
+                qc.p(angle, q)
+    return qc
+
+
+def cleanup_passes() -> list:
+    """Passes that modify the circuits generated by random_cleanup_circuit"""
+    cx_replacement = QuantumCircuit(2, global_phase=0.25)
+    cx_replacement.h(1)
+    cx_replacement.cz(0, 1)
+    cx_replacement.h(1)
+    return [
+        ModifyDelayGate(dt=20e-9),
+        RemoveZeroDelayGate(),
+        RemoveGateByName("barrier"),
+        ReplaceGate(qiskit.circuit.library.CXGate, cx_replacement, qubits=[0, 1]),
+        DecomposeU(),
+        RemoveSmallRotations(epsilon=1e-3, modulo2pi=True),
+    ]
+
+
+class TestRunPassesParallel(unittest.TestCase):
+    def test_pickle_passes(self):
+        passes = cleanup_passes()
+        qc = random_cleanup_circuit(3, 40, seed=1)
+        expected = PassManager(passes).run(qc)
+
+        unpickled_passes = pickle.loads(pickle.dumps(passes))
+        self.assertEqual(unpickled_passes[4].cache_info().currsize, 0)
+        self.assertEqual(PassManager(unpickled_passes).run(qc), expected)
+        self.assertGreater(unpickled_passes[4].cache_info().currsize, 0)
+
+    def test_run_passes_parallel(self):
+        circuits = [random_cleanup_circuit(3, 30, seed=seed) for seed in range(7)]
+        expected = [PassManager(cleanup_passes()).run(qc) for qc in circuits]
+
+        results = run_passes_parallel(circuits, cleanup_passes(), n_jobs=2, block_size=3)
+        self.assertEqual(results, expected)
+        self.assertEqual(run_passes_parallel(circuits, cleanup_passes(), n_jobs=1), expected)
+        self.assertEqual(run_passes_parallel([], cleanup_passes()), [])
+
+
+class TestTemplatePassCache(unittest.TestCase):
+    def template(self):
+        theta, phi = Parameter("theta"), Parameter("phi")
+        qc = QuantumCircuit(2, 1)
+        qc.u(theta, phi, 0.3, 0)
+        qc.rz(2 * phi, 1)
+        qc.rx(0.0, 1)
+        qc.cx(0, 1)
+        qc.measure(1, 0)
+        return qc
+
+    def passes(self):
+        return [DecomposeU(), RemoveSmallRotations(), RemoveGateByName("measure")]
+
+    def test_cache_hit(self):
+        cache = TemplatePassCache(self.passes())
+        template = self.template()
+        reference = PassManager(self.passes()).run(template)
+
+        for values in [[0.1, 0.2], [1.0, -2.0]]:
+            result = cache.run(template, values)
+            self.assertEqual(result, reference.assign_parameters(dict(zip(template.parameters, values))))
+        info = cache.cache_info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (1, 1, 1))
+
+        # same structure with different parameter objects
+        template2 = self.template()
+        values = {p: ii + 0.5 for ii, p in enumerate(template2.parameters)}
+        result = cache.run(template2, values)
+        self.assertEqual(result, reference.assign_parameters(dict(zip(template.parameters, values.values()))))
+        self.assertEqual(cache.cache_info().hits, 2)
+
+        result = cache.run(template2)
+        self.assertEqual(set(result.parameters), set(template2.parameters))
+
+        with self.assertRaises(ValueError):
+            cache.run(template, [0.1])
+
+    def test_structure_key(self):
+        cache = TemplatePassCache(self.passes(), maxsize=2)
+        cache.run(self.template(), [0.1, 0.2])
+
+        for unit in ["ns", "dt", "ns"]:
+            qc = self.template()
+            qc.delay(10, 0, unit=unit)
+            cache.run(qc, [0.1, 0.2])
+        info = cache.cache_info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (1, 3, 2))
+
+        cache.run(self.template(), [0.1, 0.2])  # evicted
+        self.assertEqual(cache.cache_info().misses, 4)
+
+        qc = QuantumCircuit(1)
+        qc.rx(0.0, 0)
+        self.assertEqual(circuit_instruction_names(cache.run(qc)), [])
+        qc = QuantumCircuit(1)
+        qc.rx(0.1, 0)
+        self.assertEqual(circuit_instruction_names(cache.run(qc)), ["rx"])
+
+        cache.cache_clear()
+        self.assertEqual(cache.cache_info().currsize, 0)
+
+    def test_control_flow(self):
+        cache = TemplatePassCache([RemoveSmallRotations()])
+        for value in [1, 0]:
+            qc = QuantumCircuit(1, 1)
+            qc.h(0)
+            qc.measure(0, 0)
+            with qc.if_test((qc.clbits[0], value)):
+                qc.x(0)
+                qc.rx(0.0, 0)
+            self.assertEqual(cache.run(qc), PassManager([RemoveSmallRotations()]).run(qc))
+        self.assertEqual(cache.cache_info().currsize, 0)
+
+    def test_pickle(self):
+        cache = TemplatePassCache(self.passes())
+        cache.run(self.template(), [0.1, 0.2])
+        cache = pickle.loads(pickle.dumps(cache))
+        self.assertEqual(cache.cache_info().currsize, 0)
+        template = self.template()
+        expected = PassManager(self.passes()).run(template).assign_parameters([0.2, 0.1])
+        self.assertEqual(cache.run(template, [0.2, 0.1]), expected)
+
+
 class TestDecomposeU(unittest.TestCase):
     def setUp(self):
         self.decompose = DecomposeU()
@@ -446,6 +1336,45 @@ class TestDecomposeU(unittest.TestCase):
         # U gate should be replaced
         self.assertNotIn("u", instruction_names)
 
+    def test_run_cache_statistics(self):
+        """Test that identical U gates share a replacement DAG"""
+        decompose = DecomposeU(cache_size=2)
+        qc = QuantumCircuit(2)
+        for ii in range(3):
+            qc.u(1.0, 2.0, 3.0, ii % 2)
+            qc.p(0.5, 0)
+        decompose(qc)
+        info = decompose.cache_info()
+        self.assertEqual((info.hits, info.misses, info.maxsize, info.currsize), (4, 2, 2, 2))
+
+        decompose.cache_clear()
+        self.assertEqual(decompose.cache_info().currsize, 0)
+
+    def test_run_angle_tolerance(self):
+        """Test that nearly identical angles share a cache entry when quantization is enabled"""
+        qc = QuantumCircuit(1)
+        for ii in range(4):
+            qc.u(1.0 + ii * 1e-9, 2.0, 3.0 - ii * 1e-9, 0)
+
+        decompose = DecomposeU()
+        result = decompose(qc)
+        self.assertEqual(decompose.cache_info().misses, 4)
+
+        decompose = DecomposeU(angle_tolerance=1e-6)
+        result_quantized = decompose(qc)
+        self.assertEqual(decompose.cache_info().misses, 1)
+        np.testing.assert_allclose(
+            qiskit.quantum_info.Operator(result_quantized).data, qiskit.quantum_info.Operator(result).data, atol=1e-6
+        )
+
+        theta = Parameter("theta")
+        qc = QuantumCircuit(1)
+        qc.u(theta, 0.1, 0.2, 0)
+        self.assertEqual(DecomposeU(angle_tolerance=1e-3)(qc), DecomposeU()(qc))
+
+        with self.assertRaises(ValueError):
+            DecomposeU(angle_tolerance=0)
+
     def test_run_with_multiple_gates(self):
         """Test decomposing multiple U gates in a circuit"""
         qc = QuantumCircuit(2)